@@ -0,0 +1,20 @@
+"""Command line options shared by the scripts that can work on an archive.
+
+Kept apart from rideArchive so a script's --help does not load it.
+"""
+
+import os
+
+
+def add_archive_arguments(parser):
+    """Add the options that select an archive subset to a script's parser."""
+    parser.add_argument("--archive", metavar="DIR",
+                        help="Work on an archive of tours and riders instead of ./fitData")
+    parser.add_argument("--tour", action="append",
+                        help="Only this tour (repeatable; default: all tours)")
+    parser.add_argument("--rider", action="append",
+                        help="Only this rider (repeatable; default: all riders)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Shards decoded in parallel (default: number of CPUs)")
+    parser.add_argument("--force", action="store_true",
+                        help="Decode every selected shard and rewrite its outputs")
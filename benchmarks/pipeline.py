@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+pipeline.py
+
+Time the decode, downsample, convert and write stages on synthetic data.
+
+Usage:
+    python benchmarks/pipeline.py --days 1 10 --hours 8 --output bench_results.json
+    python benchmarks/pipeline.py --days 10 --compare bench_results.json
+
+Every stage runs in its own child process so its peak RSS is not hidden by
+an earlier stage. Results are saved as JSON so runs can be compared across
+versions with --compare.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from benchmarks import synthetic
+
+
+def _fit_files(data_dir):
+    from buildSummaryFile import get_fit_files
+    return get_fit_files(os.path.join(data_dir, 'fitData'))
+
+
+def _gpx_files(data_dir):
+    gpx_dir = os.path.join(data_dir, 'gpxData')
+    return sorted(os.path.join(gpx_dir, f) for f in os.listdir(gpx_dir) if f.endswith('.gpx'))
+
+
+def stage_summary(data_dir):
+    from buildSummaryFile import print_summary_fields
+    files = _fit_files(data_dir)
+    summary_json = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for fit_file in files:
+            print_summary_fields(fit_file, summary_json)
+    return time.perf_counter() - start, None
+
+
+def stage_decode(data_dir):
+    from safeFitFile import open_fit_file
+    files = _fit_files(data_dir)
+    start = time.perf_counter()
+    points = sum(open_fit_file(fit_file).health['records'] for fit_file in files)
+    return time.perf_counter() - start, points
+
+
+def stage_decode_fast(data_dir):
+    from fastFitDecoder import decode_record_columns
+    files = _fit_files(data_dir)
+    start = time.perf_counter()
+    points = sum(len(decode_record_columns(fit_file)['timestamp']) for fit_file in files)
+    return time.perf_counter() - start, points
+
+
+def stage_downsample(data_dir):
+    from safeFitFile import open_fit_file
+    from drawDetailDayRoute import fit_latlon_every_n_seconds
+    files = _fit_files(data_dir)
+    # Decoding is timed too, as in downsample_fast, which decodes and samples in one call
+    start = time.perf_counter()
+    for fit_file in files:
+        fit_latlon_every_n_seconds(open_fit_file(fit_file), seconds=30)
+    return time.perf_counter() - start, None
+
+
+def stage_downsample_fast(data_dir):
+    from fastFitDecoder import fast_latlon_every_n_seconds
+    files = _fit_files(data_dir)
+    start = time.perf_counter()
+    for fit_file in files:
+        fast_latlon_every_n_seconds(fit_file, seconds=30)
+    return time.perf_counter() - start, None
+
+
+def stage_parse_gpx(data_dir):
+    from convertGpx2Kml import parse_gpx
+    files = _gpx_files(data_dir)
+    start = time.perf_counter()
+    points = 0
+    for gpx_file in files:
+        _, _, tracks = parse_gpx(gpx_file)
+        points += sum(len(seg) for t in tracks for seg in t['segments'])
+    return time.perf_counter() - start, points
+
+
+def stage_build_kml(data_dir):
+    from convertGpx2Kml import parse_gpx, build_kml
+    parsed = [parse_gpx(gpx_file) for gpx_file in _gpx_files(data_dir)]
+    start = time.perf_counter()
+    for waypoints, routes, tracks in parsed:
+        build_kml(waypoints, routes, tracks)
+    return time.perf_counter() - start, None
+
+
+def stage_write_kml(data_dir):
+    import xml.etree.ElementTree as ET
+    from convertGpx2Kml import parse_gpx, build_kml
+    from compressedFiles import open_output
+    kml_elems = [build_kml(*parse_gpx(gpx_file)) for gpx_file in _gpx_files(data_dir)]
+    with tempfile.TemporaryDirectory() as out_dir:
+        start = time.perf_counter()
+        # The same serialization as convertGpx2Kml.main
+        for idx, kml_elem in enumerate(kml_elems):
+            with open_output(os.path.join(out_dir, f'{idx}.kml')) as f:
+                ET.indent(kml_elem)
+                ET.ElementTree(kml_elem).write(f, encoding="utf-8", xml_declaration=True)
+        return time.perf_counter() - start, None
+
+
+def stage_kml_to_gpx(data_dir):
+    from convertKml2Gpx import kml_to_gpx
+    with tempfile.TemporaryDirectory() as out_dir:
+        start = time.perf_counter()
+        kml_to_gpx(os.path.join(data_dir, 'route.kml'), os.path.join(out_dir, 'route.gpx'))
+        return time.perf_counter() - start, None
+
+
+STAGES = {
+    'summary': stage_summary,
+    'decode': stage_decode,
+    'decode_fast': stage_decode_fast,
+    'downsample': stage_downsample,
+    'downsample_fast': stage_downsample_fast,
+    'parse_gpx': stage_parse_gpx,
+    'build_kml': stage_build_kml,
+    'write_kml': stage_write_kml,
+    'kml_to_gpx': stage_kml_to_gpx,
+}
+
+
+def run_stage_in_child(stage, data_dir):
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--stage', stage, '--dataDir', data_dir],
+        cwd=REPO_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed'}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_size(days, hours, stages, seed):
+    with tempfile.TemporaryDirectory() as data_dir:
+        info = synthetic.generate(data_dir, days, hours, seed)
+        size = {'days': days, 'hours': hours, 'points': info['points'], 'stages': {}}
+        for stage in stages:
+            measured = run_stage_in_child(stage, data_dir)
+            if 'error' not in measured:
+                points = measured['points'] or info['points']
+                measured['points'] = points
+                measured['points_per_s'] = points / measured['seconds'] if measured['seconds'] else None
+            size['stages'][stage] = measured
+            print_stage(days, stage, measured)
+        return size
+
+
+def print_stage(days, stage, measured):
+    if 'error' in measured:
+        print(f"{days:>4}d {stage:<16} ERROR {measured['error']}")
+        return
+    peak = measured['peak_rss_mb']
+    print(f"{days:>4}d {stage:<16} {measured['seconds']:8.3f} s  "
+          f"{measured['points_per_s']:>12,.0f} points/s  peak RSS "
+          + (f"{peak:7.1f} MB" if peak is not None else "    n/a"))
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (revision {baseline.get('revision')}):")
+    old_sizes = {(s['days'], s['hours']): s for s in baseline.get('sizes', [])}
+    for size in results['sizes']:
+        old = old_sizes.get((size['days'], size['hours']))
+        if old is None:
+            continue
+        for stage, measured in size['stages'].items():
+            before = old['stages'].get(stage, {}).get('points_per_s')
+            after = measured.get('points_per_s')
+            if before and after:
+                print(f"{size['days']:>4}d {stage:<16} {after / before:6.2f}x points/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ride pipeline on synthetic data.")
+    parser.add_argument("--days", type=int, nargs='+', default=[1],
+                        help="Tour lengths in days to benchmark (default: 1)")
+    parser.add_argument("--hours", type=float, default=8.0,
+                        help="Hours of 1 Hz records per day (default: 8)")
+    parser.add_argument("--stages", nargs='+', choices=list(STAGES), default=list(STAGES),
+                        help="Stages to run (default: all)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed for the synthetic data (default: 0)")
+    parser.add_argument("--output", default="bench_results.json",
+                        help="Results JSON file (default: bench_results.json)")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--stage", help=argparse.SUPPRESS)
+    parser.add_argument("--dataDir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.stage:
+        # Child process: run one stage and report it on stdout
+        seconds, points = STAGES[args.stage](args.dataDir)
+        from runReport import peak_rss_mb
+        print(json.dumps({'seconds': seconds, 'points': points, 'peak_rss_mb': peak_rss_mb()}))
+        return 0
+
+    results = {
+        'revision': git_revision(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sizes': [run_size(days, args.hours, args.stages, args.seed) for days in args.days],
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
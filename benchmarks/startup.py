@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+startup.py
+
+Measure cold-start time of the biking.py commands with `python -X importtime`.
+
+Usage:
+    python benchmarks/startup.py [--budgetMs 100] [--runs 5]
+
+Each command is started with --help, which must not pull in any heavy
+dependency. Exits non-zero if any command's median startup exceeds the budget.
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from biking import COMMANDS
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)")
+
+
+def measure(command_args, runs):
+    """Return (median wall ms, import ms, slowest top-level imports) for one command."""
+    wall_times = []
+    imports = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", os.path.join(REPO_DIR, "biking.py")] + command_args,
+            cwd=REPO_DIR, capture_output=True, text=True)
+        wall_times.append((time.perf_counter() - start) * 1000.0)
+        imports = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_LINE.match(line)
+            # Only top-level imports; nested ones are already in the cumulative time
+            if match and len(match.group(3)) == 1:
+                imports.append((int(match.group(2)) / 1000.0, match.group(4)))
+    imports.sort(reverse=True)
+    return statistics.median(wall_times), sum(ms for ms, _ in imports), imports[:3]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure biking.py cold-start time.")
+    parser.add_argument("--budgetMs", type=float, default=100.0,
+                        help="Maximum median startup time per command in ms (default: 100)")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Runs per command (default: 5)")
+    args = parser.parse_args(argv)
+
+    over_budget = []
+    for command_args in [[]] + [[name, "--help"] for name in COMMANDS]:
+        label = " ".join(command_args) or "(no command)"
+        wall_ms, import_ms, slowest = measure(command_args, args.runs)
+        top = ", ".join(f"{name} {ms:.1f}ms" for ms, name in slowest)
+        print(f"{label:<24} wall {wall_ms:6.1f} ms  imports {import_ms:6.1f} ms  [{top}]")
+        if wall_ms > args.budgetMs:
+            over_budget.append(label)
+
+    if over_budget:
+        print(f"Over the {args.budgetMs:.0f} ms budget: {', '.join(over_budget)}")
+        return 1
+    print(f"All commands start within {args.budgetMs:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
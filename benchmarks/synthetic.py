@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+synthetic.py
+
+Generate synthetic multi-day ride data for benchmarking.
+
+Usage:
+    python benchmarks/synthetic.py --outputDir bench_data --days 10 --hours 8
+
+Writes fitData/Day_NN.fit (1 Hz records plus file_id, session and activity
+messages), gpxData/Day_NN.gpx and a single route.kml shaped like
+us_ride_detail.kml. The same seed always produces the same files.
+"""
+
+import argparse
+import math
+import os
+import random
+import struct
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from safeFitFile import fit_crc
+
+FIT_EPOCH = 631065600
+SEMICIRCLES = 2147483648.0 / 180.0
+
+# FIT base types
+ENUM, SINT8, UINT16, SINT32, UINT32, UINT32Z = 0x00, 0x01, 0x84, 0x85, 0x86, 0x8C
+
+# (field number, base type, struct code) per message, in write order
+FILE_ID_FIELDS = [(0, ENUM, 'B'), (1, UINT16, 'H'), (2, UINT16, 'H'), (3, UINT32Z, 'I'), (4, UINT32, 'I')]
+RECORD_FIELDS = [(253, UINT32, 'I'), (0, SINT32, 'i'), (1, SINT32, 'i'), (5, UINT32, 'I'),
+                 (2, UINT16, 'H'), (6, UINT16, 'H'), (13, SINT8, 'b')]
+SESSION_FIELDS = [(253, UINT32, 'I'), (2, UINT32, 'I'), (3, SINT32, 'i'), (4, SINT32, 'i'),
+                  (7, UINT32, 'I'), (8, UINT32, 'I'), (9, UINT32, 'I'), (11, UINT16, 'H'),
+                  (14, UINT16, 'H'), (15, UINT16, 'H'), (22, UINT16, 'H'), (23, UINT16, 'H'),
+                  (57, SINT8, 'b'), (58, SINT8, 'b'), (124, UINT32, 'I'), (125, UINT32, 'I')]
+ACTIVITY_FIELDS = [(253, UINT32, 'I'), (0, UINT32, 'I'), (1, UINT16, 'H'), (2, ENUM, 'B'),
+                   (3, ENUM, 'B'), (4, ENUM, 'B')]
+
+
+def definition_message(local_mesg_num, global_mesg_num, fields):
+    out = struct.pack('<BBBHB', 0x40 | local_mesg_num, 0, 0, global_mesg_num, len(fields))
+    for num, base_type, code in fields:
+        out += struct.pack('3B', num, struct.calcsize(code), base_type)
+    return out
+
+
+def data_struct(fields):
+    return struct.Struct('<B' + ''.join(code for _, _, code in fields))
+
+
+def ride_track(day, points, start_lat, start_lon, seed=0):
+    """Yield (lat, lon, altitude m, speed m/s, temperature C) at 1 Hz for one day.
+
+    The track wanders roughly east, like a cross-country tour.
+    """
+    rng = random.Random(seed * 1000 + day)
+    lat, lon = start_lat, start_lon
+    heading = math.radians(90 + rng.uniform(-30, 30))
+    altitude = rng.uniform(50, 1500)
+    for i in range(points):
+        heading += rng.gauss(0, 0.02)
+        speed = max(0.0, 7.0 + 2.0 * math.sin(i / 600.0) + rng.gauss(0, 0.3))
+        lat += speed * math.cos(heading) / 111320.0
+        lon += speed * math.sin(heading) / (111320.0 * math.cos(math.radians(lat)))
+        altitude = min(max(altitude + rng.gauss(0, 0.5), 0.0), 3500.0)
+        temperature = 18.0 + 8.0 * math.sin(math.pi * i / max(points, 1)) + rng.gauss(0, 0.5)
+        yield lat, lon, altitude, speed, temperature
+
+
+def write_fit_day(path, day, points, start_lat, start_lon, start_time, seed=0):
+    """Write one day as a FIT activity file; returns the end (lat, lon)."""
+    record = data_struct(RECORD_FIELDS)
+    body = bytearray()
+    body += definition_message(0, 0, FILE_ID_FIELDS)
+    body += data_struct(FILE_ID_FIELDS).pack(0, 4, 1, 3122, 1000 + day, start_time - FIT_EPOCH)
+    body += definition_message(1, 20, RECORD_FIELDS)
+
+    lat, lon = start_lat, start_lon
+    distance = 0.0
+    ascent = descent = 0.0
+    last_altitude = None
+    max_speed = 0.0
+    temperatures = []
+    for i, (lat, lon, altitude, speed, temperature) in enumerate(
+            ride_track(day, points, start_lat, start_lon, seed)):
+        distance += speed
+        if last_altitude is not None:
+            if altitude > last_altitude:
+                ascent += altitude - last_altitude
+            else:
+                descent += last_altitude - altitude
+        last_altitude = altitude
+        max_speed = max(max_speed, speed)
+        temperatures.append(temperature)
+        body += record.pack(1, start_time - FIT_EPOCH + i, int(lat * SEMICIRCLES), int(lon * SEMICIRCLES),
+                            int(distance * 100), int((altitude + 500) * 5), int(speed * 1000),
+                            int(round(temperature)))
+
+    end_time = start_time - FIT_EPOCH + points
+    avg_speed = distance / points if points else 0.0
+    body += definition_message(2, 18, SESSION_FIELDS)
+    body += data_struct(SESSION_FIELDS).pack(
+        2, end_time, start_time - FIT_EPOCH, int(start_lat * SEMICIRCLES), int(start_lon * SEMICIRCLES),
+        points * 1000, points * 1000, int(distance * 100), int(distance / 40),
+        int(avg_speed * 1000), int(max_speed * 1000), int(ascent), int(descent),
+        int(round(sum(temperatures) / len(temperatures))) if temperatures else 0,
+        int(round(max(temperatures))) if temperatures else 0,
+        int(avg_speed * 1000), int(max_speed * 1000))
+    body += definition_message(3, 34, ACTIVITY_FIELDS)
+    body += data_struct(ACTIVITY_FIELDS).pack(3, end_time, points * 1000, 1, 0, 26, 1)
+
+    header = struct.pack('<2BHI4s', 14, 0x20, 2132, len(body), b'.FIT')
+    header += struct.pack('<H', fit_crc(header))
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+        f.write(struct.pack('<H', fit_crc(body, fit_crc(header))))
+    return lat, lon
+
+
+def write_gpx_day(path, day, points, start_lat, start_lon, seed=0):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<gpx version="1.1" creator="synthetic" xmlns="http://www.topografix.com/GPX/1/1">\n'
+                f'  <trk>\n    <name>Day {day:02d}</name>\n    <trkseg>\n')
+        for lat, lon, altitude, _, _ in ride_track(day, points, start_lat, start_lon, seed):
+            f.write(f'      <trkpt lat="{lat}" lon="{lon}"><ele>{altitude:.1f}</ele></trkpt>\n')
+        f.write('    </trkseg>\n  </trk>\n</gpx>\n')
+
+
+def write_kml(path, day_starts, days, points, seed=0):
+    """Write all days as one LineString plus a labeled start point per day."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<kml xmlns="http://www.opengis.net/kml/2.2">\n<Document>\n    <name>Synthetic Ride</name>\n')
+        for day, (lat, lon) in enumerate(day_starts, start=1):
+            f.write(f'    <Placemark>\n        <name>{day:02d}</name>\n        <Point>\n'
+                    f'            <coordinates>{lon},{lat},0.0</coordinates>\n        </Point>\n    </Placemark>\n')
+        f.write('    <Placemark>\n        <name>Synthetic Ride Detail</name>\n        <LineString>\n'
+                '            <coordinates>')
+        for day, (start_lat, start_lon) in enumerate(day_starts, start=1):
+            for lat, lon, _, _, _ in ride_track(day, points, start_lat, start_lon, seed):
+                f.write(f'{lon},{lat},0.0 ')
+        f.write('</coordinates>\n        </LineString>\n    </Placemark>\n</Document>\n</kml>\n')
+
+
+def generate(output_dir, days=1, hours=8.0, seed=0, formats=('fit', 'gpx', 'kml')):
+    """Generate `days` days of 1 Hz data; returns a description of what was written."""
+    points = int(hours * 3600)
+    fit_dir = os.path.join(output_dir, 'fitData')
+    gpx_dir = os.path.join(output_dir, 'gpxData')
+    lat, lon = 48.4988, -122.6840
+    start_time = 1717225200  # 2024-06-01 07:00 UTC
+    day_starts = []
+    for day in range(1, days + 1):
+        day_starts.append((lat, lon))
+        if 'fit' in formats:
+            os.makedirs(fit_dir, exist_ok=True)
+            end = write_fit_day(os.path.join(fit_dir, f'Day_{day:02d}.fit'), day, points, lat, lon,
+                                start_time + (day - 1) * 86400, seed)
+        else:
+            end = list(ride_track(day, points, lat, lon, seed))[-1][:2] if points else (lat, lon)
+        if 'gpx' in formats:
+            os.makedirs(gpx_dir, exist_ok=True)
+            write_gpx_day(os.path.join(gpx_dir, f'Day_{day:02d}.gpx'), day, points, lat, lon, seed)
+        lat, lon = end
+    kml_path = os.path.join(output_dir, 'route.kml')
+    if 'kml' in formats:
+        os.makedirs(output_dir, exist_ok=True)
+        write_kml(kml_path, day_starts, days, points, seed)
+    return {
+        'days': days,
+        'points_per_day': points,
+        'points': days * points,
+        'fit_dir': fit_dir,
+        'gpx_dir': gpx_dir,
+        'kml_path': kml_path,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic FIT, GPX and KML ride data.")
+    parser.add_argument("--outputDir", default="bench_data",
+                        help="Output directory (default: bench_data)")
+    parser.add_argument("--days", type=int, default=1,
+                        help="Number of days to generate (default: 1)")
+    parser.add_argument("--hours", type=float, default=8.0,
+                        help="Hours of 1 Hz records per day (default: 8)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed (default: 0)")
+    args = parser.parse_args(argv)
+
+    info = generate(args.outputDir, args.days, args.hours, args.seed)
+    print(f"Wrote {info['days']} days, {info['points']} points to {args.outputDir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+biking.py
+
+Single entry point for the ride scripts.
+
+Usage:
+    python biking.py [--report [FILE]] [--profile [FILE]] <command> [options]
+    python biking.py <command> --help
+
+--report appends a JSON run report (stage wall/CPU times, per-file records
+and points/s, peak memory) to FILE, default run_reports.jsonl.
+--profile runs the command under cProfile, saves the stats to FILE
+(default biking.pstats) and prints the most expensive calls.
+
+Each command's module is only imported when that command runs, so heavy
+dependencies (fitparse, simplekml, fit2gpx) never slow down --help or
+unrelated commands.
+"""
+
+import sys
+import importlib
+
+# command -> (module, description)
+COMMANDS = {
+    'summary': ('buildSummaryFile', "Build summary.json from the FIT files in ./fitData"),
+    'query': ('queryRoutes', "Print record fields, totals or summaries from the FIT files"),
+    'draw-day': ('drawDayRoute', "Draw ride start locations from summary.json"),
+    'draw-detail': ('drawDetailRoute', "Draw the route sampled every 10 minutes"),
+    'draw-detail-day': ('drawDetailDayRoute', "Draw the detailed route with a start point per day"),
+    'kml2gpx': ('convertKml2Gpx', "Convert a KML file to GPX"),
+    'gpx2kml': ('convertGpx2Kml', "Convert a GPX file to KML"),
+    'to-gpx': ('convertToGpx', "Convert every FIT file in ./fitData to GPX"),
+    'watch': ('watchFitData', "Watch ./fitData and append new rides to the outputs"),
+    'serve': ('rideServer', "Serve the decoded ride archive over local HTTP/JSON"),
+    'archive': ('rideArchive', "Build per-rider outputs for a multi-tour archive (./archive)"),
+    'compare': ('compareRoutes', "Compare the rides in ./fitData with a planned KML/GPX route"),
+    'heatmap': ('rideHeatmap', "Draw a visit-density heatmap of every ride (ride_heatmap.kml)"),
+    'db': ('rideDatabase', "Export the FIT files to a SQLite database (rides.db)"),
+    'merge': ('mergeAllRountes', "Concatenate the FIT files in ./test into allRoutes.fit"),
+}
+
+
+def print_usage():
+    print("usage: biking.py [--report [FILE]] [--profile [FILE]] <command> [options]\n\ncommands:")
+    for name, (_, description) in COMMANDS.items():
+        print(f"  {name:<16} {description}")
+
+
+def run_profiled(func, args, stats_path):
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(func, args)
+    finally:
+        profiler.dump_stats(stats_path)
+        print(f"\nProfile written to {stats_path}")
+        pstats.Stats(stats_path).sort_stats('cumulative').print_stats(25)
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    options = {}
+    while argv and argv[0] in ('--report', '--profile'):
+        option = argv.pop(0)
+        default = 'run_reports.jsonl' if option == '--report' else 'biking.pstats'
+        # The file name is optional; anything that is a command is not a file name
+        if argv and argv[0] not in COMMANDS and not argv[0].startswith('-'):
+            options[option] = argv.pop(0)
+        else:
+            options[option] = default
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage()
+        return 0
+    command, args = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"Unknown command: {command}")
+        print_usage()
+        return 2
+    module = importlib.import_module(COMMANDS[command][0])
+    if '--report' in options:
+        import runReport
+        runReport.start_report(command, args)
+    try:
+        if '--profile' in options:
+            run_profiled(module.main, args, options['--profile'])
+        else:
+            module.main(args)
+    finally:
+        if '--report' in options:
+            runReport.finish_report(options['--report'])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
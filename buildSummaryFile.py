@@ -1,88 +1,32 @@
+import argparse
 import os
 import re
 import sys
-import glob
-from fitparse import FitFile
+from safeFitFile import open_fit_file, write_error_log
+from compressedFiles import list_fit_files
+from runReport import stage
+from archiveArguments import add_archive_arguments
+from units import add_units_argument, convert_columns, convert_value, unit_label
 
-def print_summary_fields(fit_file, summary_json=None):
-    fitfile = FitFile(fit_file)
-    fitfile_name = os.path.basename(fit_file)
+def print_summary_fields(fit_file, summary_json=None, error_log=None, units='imperial'):
+    fitfile = open_fit_file(fit_file, error_log)
+    if fitfile is None:
+        print(f"\nFile: {os.path.basename(fit_file)} could not be decoded, skipping.")
+        return None
     print(f"\nFile: {os.path.basename(fit_file)}")
-    summary = {}
-    # Collect summary fields from activity, session, and file_id messages
-    for msg_type in ['activity', 'session', 'file_id']:
-        for msg in fitfile.get_messages(msg_type):
-            for field in msg:
-                summary[field.name] = field.value
-    # Find ending lat/long from last record
-    end_lat = None
-    end_long = None
-    for record in fitfile.get_messages('record'):
-        lat = None
-        lon = None
-        for field in record:
-            if field.name == 'position_lat':
-                lat = field.value
-            elif field.name == 'position_long':
-                lon = field.value
-        if lat is not None and lon is not None:
-            end_lat = lat
-            end_long = lon
-
-    # Print summary fields
-    if summary:
-        summary_record = {'fitFileName': fitfile_name}
-        for k, v in summary.items():
-            if k in [
-                'max_temperature', 
-                'min_temperature',
-                'avg_temperature',
-                'total_distance',
-                'total_ascent',
-                'total_descent',
-                'total_calories',
-                'total_eplasped_time',
-                'enhanced_elapsed_time',
-                'enhanced_avg_speed',
-                'enhanced_max_speed',
-                'avg_speed',
-                'max_speed',
-                "start_position_lat",
-                "start_position_long",]:
-                if "speed" in k:
-                    v = v * 2.23694
-                elif "temp" in k:
-                    v = v * 1.8 + 32
-                elif "ascent" in k or "descent" in k:
-                    v = v * 3.28084
-                elif "distance" in k:
-                    v = v / 1609.34
-                elif "start_position" in k:
-                    v = v * (180.0 / 2147483648.0)  # Convert to degrees
+    from summaryRecord import SummaryRecord
 
-                if isinstance(v, (float)):
-                    if k in ("start_position_lat", "start_position_long"):
-                        v = f"{v:.6f}"
-                    else:
-                        v = f"{v:.2f}"
-                elif isinstance(v, (int)):
-                    v = f"{v}"
-                print(f"{k}: {v}")
-                summary_record.update({k: v})
-        # Print ending lat/long if found
-        if end_lat is not None and end_long is not None:
-            end_lat_deg = end_lat * (180.0 / 2147483648.0)
-            end_long_deg = end_long * (180.0 / 2147483648.0)
-            print(f"end_position_lat: {end_lat_deg:.6f}")
-            print(f"end_position_long: {end_long_deg:.6f}")
-            summary_record.update({
-                "end_position_lat": f"{end_lat_deg:.6f}",
-                "end_position_long": f"{end_long_deg:.6f}"
-            })
-        if summary_json is not None:
-            summary_json.append(summary_record)
-    else:
+    record = SummaryRecord.from_fit(fit_file, fitfile)
+    if record is None:
         print("No summary fields found.")
+        return None
+    # Values are only formatted for display; summary_json keeps the typed record
+    for k, v in record.to_summary_json(units).items():
+        if k != 'fitFileName':
+            print(f"{k}: {v}")
+    if summary_json is not None:
+        summary_json.append(record)
+    return record
 
 
 def extract_day_number(filename):
@@ -90,12 +34,14 @@ def extract_day_number(filename):
     return int(match.group(1)) if match else float('inf')
 
 def get_fit_files(directory):
-    files = glob.glob(os.path.join(directory, '*.fit'))
+    files = list_fit_files(directory)
     files.sort(key=extract_day_number)
     return files
 
-def list_all_fields(fit_file):
-    fitfile = FitFile(fit_file)
+def list_all_fields(fit_file, error_log=None):
+    fitfile = open_fit_file(fit_file, error_log)
+    if fitfile is None:
+        return []
     fields = set()
     for record in fitfile.get_messages('record'):
         for field in record:
@@ -103,8 +49,10 @@ def list_all_fields(fit_file):
     return sorted(fields)
 
 
-def print_total_fields(fit_file, field_names):
-    fitfile = FitFile(fit_file)
+def print_total_fields(fit_file, field_names, error_log=None, units='imperial'):
+    fitfile = open_fit_file(fit_file, error_log)
+    if fitfile is None:
+        return
     print(f"File: {os.path.basename(fit_file)}")
     totals = {field: 0.0 for field in field_names}
     timestamps = []
@@ -128,8 +76,7 @@ def print_total_fields(fit_file, field_names):
                 if field.name == 'distance' and field.value is not None:
                     last_distance = field.value
         if last_distance is not None:
-            # Convert meters to miles
-            totals['distance'] = last_distance * 0.000621371
+            totals['distance'] = convert_value(last_distance, 'distance', units)
     # Special handling for duration and elapsed_time
     if 'duration' in field_names:
         if timestamps:
@@ -148,7 +95,7 @@ def print_total_fields(fit_file, field_names):
     row = []
     for field in field_names:
         if field == 'distance':
-            row.append(f"{field}: {totals[field]:.2f} miles")
+            row.append(f"{field}: {totals[field]:.2f} {unit_label('distance', units)}")
         elif field in ('duration', 'elapsed_time'):
             # Print as H:MM:SS
             seconds = int(totals[field])
@@ -160,34 +107,48 @@ def print_total_fields(fit_file, field_names):
             row.append(f"{field}: {totals[field]}")
     print(", ".join(row))
 
-def print_selected_fields(fit_file, field_names):
-    fitfile = FitFile(fit_file)
+def print_selected_fields(fit_file, field_names, error_log=None, units=None):
+    fitfile = open_fit_file(fit_file, error_log)
+    if fitfile is None:
+        return
     print(f"\nFile: {os.path.basename(fit_file)}")
+    columns = {field_name: [] for field_name in field_names}
     for record in fitfile.get_messages('record'):
-        row = []
+        values = {}
+        for field in record:
+            values.setdefault(field.name, field.value)
         for field_name in field_names:
-            value = None
-            for field in record:
-                if field.name == field_name:
-                    value = field.value
-                    break
-            row.append(str(value) if value is not None else "N/A")
-        print(", ".join(row))
+            columns[field_name].append(values.get(field_name))
+    if units:
+        columns = convert_columns(columns, units)
+    for row in zip(*(columns[field_name] for field_name in field_names)):
+        print(", ".join(str(value) if value is not None else "N/A" for value in row))
+
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build summary.json from the FIT files in ./fitData.")
+    add_archive_arguments(parser)
+    add_units_argument(parser)
+    args, _ = parser.parse_known_args(argv)
+    if args.archive:
+        from rideArchive import run_from_args
+        return run_from_args(args, ['summary'])
 
-def main():
     fit_dir = './fitData'
     fit_files = get_fit_files(fit_dir)
 
     summary_json = []
-    for fit_file in fit_files:
-        print_summary_fields(fit_file, summary_json)
+    error_log = []
+    with stage('summarize'):
+        for fit_file in fit_files:
+            print_summary_fields(fit_file, summary_json, error_log, args.units)
     # write summary to a JSON file
     summary_file = os.path.join('./', 'summary.json')
-    with open(summary_file, 'w') as f:
-        import json
-        json.dump(summary_json, f, indent=4)
+    with stage('write'):
+        from summaryRecord import write_summary_json
+        write_summary_json(summary_json, summary_file, args.units)
     print(f"Summary written to {summary_file}")
+    write_error_log(error_log)
 
 if __name__ == "__main__":
     main()
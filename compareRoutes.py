@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+"""
+compareRoutes.py
+
+Compare the rides recorded in ./fitData with a planned route.
+
+Usage:
+    python compareRoutes.py --plan planned.kml [--fitDir ./fitData] [--fit Day_03.fit ...]
+                            [--threshold 100] [--output route_comparison.json]
+
+The plan is every LineString in a KML file, or every route and track in a
+GPX file, each a separate line; the gaps between them are not part of the
+plan. Each day's track is matched point by point to the nearest planned
+segment through a grid index over the plan, and the report gives per day:
+    off-route segments   runs of points farther than --threshold meters
+    extra distance       ridden distance minus the planned distance between
+                         where the day first and last matched the plan
+    hausdorff            largest distance in meters from a recorded point to
+                         the plan, or from a planned point on that stretch
+                         to the nearest recorded point
+"""
+
+import argparse
+import bisect
+import heapq
+import json
+import math
+import os
+from collections import defaultdict
+
+from runReport import stage
+
+EARTH_RADIUS = 6371008.8
+
+
+def mercator(lats, lons):
+    """Project to Web Mercator meters.
+
+    Mercator is conformal, so near a point at latitude lat a projected
+    distance times cos(lat) is the distance on the ground.
+    """
+    xs = [EARTH_RADIUS * math.radians(lon) for lon in lons]
+    ys = [EARTH_RADIUS * math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) for lat in lats]
+    return xs, ys
+
+
+def path_lengths(xs, ys, lats):
+    """Cumulative ground distance in meters at each point of a projected polyline."""
+    cumulative = [0.0]
+    total = 0.0
+    cos, radians, hypot = math.cos, math.radians, math.hypot
+    for i in range(1, len(xs)):
+        total += hypot(xs[i] - xs[i - 1], ys[i] - ys[i - 1]) * cos(radians((lats[i] + lats[i - 1]) / 2))
+        cumulative.append(total)
+    return cumulative
+
+
+def segment_cells(ax, ay, bx, by, cell):
+    """Yield every grid cell the segment from (ax, ay) to (bx, by) crosses or touches."""
+    if ax > bx:
+        ax, ay, bx, by = bx, by, ax, ay
+    cx0, cx1 = int(ax // cell), int(bx // cell)
+    slope = (by - ay) / (bx - ax) if bx > ax else 0.0
+    for cx in range(cx0, cx1 + 1):
+        # Where the segment enters and leaves this column of cells
+        y0 = ay if cx == cx0 else ay + (cx * cell - ax) * slope
+        y1 = by if cx == cx1 else ay + ((cx + 1) * cell - ax) * slope
+        if y0 > y1:
+            y0, y1 = y1, y0
+        for cy in range(int(y0 // cell), int(y1 // cell) + 1):
+            yield cx, cy
+
+
+class GridIndex(object):
+    """Uniform grid of cells keyed (column, row), each listing the items in it.
+
+    Coarser grids, each cell covering 4 x 4 cells of the one below, lead
+    to the cells far from a point without visiting every cell in between.
+    """
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.cells = defaultdict(list)
+
+    def build_levels(self):
+        """Build the coarser grids once every item is in a cell."""
+        # children[k] maps a cell of grid k + 1 to its non-empty cells in grid k
+        self.children = []
+        keys = list(self.cells)
+        while len(keys) > 16:
+            parents = defaultdict(list)
+            for cx, cy in keys:
+                parents[(cx >> 2, cy >> 2)].append((cx, cy))
+            self.children.append(parents)
+            keys = list(parents)
+        self.top = keys
+
+    def cells_by_distance(self, x, y):
+        """Yield (squared distance, items) of the non-empty cells, nearest to (x, y) first."""
+        sizes = [self.cell * 4 ** level for level in range(len(self.children) + 1)]
+
+        def distance2(level, key):
+            size = sizes[level]
+            ex = key[0] * size - x
+            if ex < 0.0:
+                ex = x - (key[0] + 1) * size
+                if ex < 0.0:
+                    ex = 0.0
+            ey = key[1] * size - y
+            if ey < 0.0:
+                ey = y - (key[1] + 1) * size
+                if ey < 0.0:
+                    ey = 0.0
+            return ex * ex + ey * ey
+
+        top = len(self.children)
+        heap = [(distance2(top, key), top, key) for key in self.top]
+        heapq.heapify(heap)
+        while heap:
+            d2, level, key = heapq.heappop(heap)
+            if level == 0:
+                yield d2, self.cells[key]
+            else:
+                for child in self.children[level - 1][key]:
+                    heapq.heappush(heap, (distance2(level - 1, child), level - 1, child))
+
+
+def closest_segment(x, y, segments, best=math.inf, best_seg=None, best_t=0.0):
+    """Return (squared distance, segment, fraction) of the segment closest to (x, y).
+
+    best, best_seg and best_t are the closest found so far, kept unless a
+    segment is closer.
+    """
+    for seg in segments:
+        ax, ay, dx, dy, len2, _ = seg
+        t = ((x - ax) * dx + (y - ay) * dy) / len2 if len2 else 0.0
+        if t < 0.0:
+            t = 0.0
+        elif t > 1.0:
+            t = 1.0
+        ex = ax + t * dx - x
+        ey = ay + t * dy - y
+        d2 = ex * ex + ey * ey
+        if d2 < best:
+            best, best_seg, best_t = d2, seg, t
+    return best, best_seg, best_t
+
+
+class SegmentIndex(GridIndex):
+    """Grid over the segments of projected polylines, for nearest-segment queries.
+
+    starts lists the points that begin a segment, so separate lines are not
+    joined. Each segment is listed in the cells it crosses. Without a cell
+    size the cells are twice the mean segment length, so a cell holds only
+    a few segments whatever the sampling rate of the lines.
+    """
+
+    # A search box of up to this many cells is scanned directly
+    NEAR_CELLS = 25
+
+    def __init__(self, xs, ys, starts, cell=None):
+        # (ax, ay, dx, dy, squared length, start point) of each segment
+        self.segments = segments = [(xs[i], ys[i], xs[i + 1] - xs[i], ys[i + 1] - ys[i],
+                                     (xs[i + 1] - xs[i]) ** 2 + (ys[i + 1] - ys[i]) ** 2, i)
+                                    for i in starts]
+        self.by_start = {seg[5]: seg for seg in segments}
+        if cell is None:
+            cell = 2 * sum(math.sqrt(seg[4]) for seg in segments) / len(segments) if segments else 1.0
+        cell = cell or 1.0
+        GridIndex.__init__(self, cell)
+        cells = self.cells
+        for seg in segments:
+            ax, ay, dx, dy = seg[:4]
+            cx, cy = int(ax // cell), int(ay // cell)
+            if cx == int((ax + dx) // cell) and cy == int((ay + dy) // cell):
+                cells[(cx, cy)].append(seg)
+                continue
+            for key in segment_cells(ax, ay, ax + dx, ay + dy, cell):
+                cells[key].append(seg)
+        self.build_levels()
+
+    def nearest(self, x, y, hint=None):
+        """Return (projected distance, segment start, fraction) of the segment nearest (x, y).
+
+        The cell holding (x, y) is searched first: if the nearest segment in
+        it is closer than the cell's edges, no other segment can be closer.
+        Otherwise the cells within that distance are searched, or within the
+        distance to hint, a segment expected to be close (the previous
+        point's match), if the cell is empty. Far from the plan the cells are
+        searched nearest first instead.
+        """
+        cells = self.cells
+        cell = self.cell
+        cx = x // cell
+        cy = y // cell
+        best, best_seg, best_t = closest_segment(x, y, cells.get((int(cx), int(cy)), ()))
+        # A closer segment passes within sqrt(best) of (x, y): through this cell if that circle fits in it
+        edge = min(x - cx * cell, (cx + 1) * cell - x, y - cy * cell, (cy + 1) * cell - y)
+        if best > edge * edge:
+            if best_seg is None and hint in self.by_start:
+                best, best_seg, best_t = closest_segment(x, y, (self.by_start[hint],))
+            box = None
+            if best_seg is not None:
+                radius = math.sqrt(best)
+                x0, x1 = int((x - radius) // cell), int((x + radius) // cell)
+                y0, y1 = int((y - radius) // cell), int((y + radius) // cell)
+                if (x1 - x0 + 1) * (y1 - y0 + 1) <= self.NEAR_CELLS:
+                    # Any segment within `radius` crosses a cell of this box
+                    box = [seg for gx in range(x0, x1 + 1) for gy in range(y0, y1 + 1)
+                           for seg in cells.get((gx, gy), ())]
+            if box is not None:
+                best, best_seg, best_t = closest_segment(x, y, box, best, best_seg, best_t)
+            else:
+                best, best_seg, best_t = self._search(x, y, best, best_seg, best_t)
+        if best_seg is None:
+            return best, -1, best_t
+        return math.sqrt(best), best_seg[5], best_t
+
+    def _search(self, x, y, best, best_seg, best_t):
+        """Search the cells nearest first for a segment closer than best."""
+        for d2, segments in self.cells_by_distance(x, y):
+            if d2 >= best:
+                break
+            best, best_seg, best_t = closest_segment(x, y, segments, best, best_seg, best_t)
+        return best, best_seg, best_t
+
+
+def closest_point(x, y, points, best=math.inf):
+    """Return the smaller of best and the squared distance from (x, y) to the closest of points."""
+    for px, py in points:
+        ex = px - x
+        ey = py - y
+        d2 = ex * ex + ey * ey
+        if d2 < best:
+            best = d2
+    return best
+
+
+class PointIndex(GridIndex):
+    """Grid over points, for nearest-point queries."""
+
+    # Rings of cells searched around a point before going by distance instead
+    NEAR_RINGS = 2
+
+    def __init__(self, xs, ys, cell):
+        GridIndex.__init__(self, cell)
+        cells = self.cells
+        for x, y in zip(xs, ys):
+            cells[(int(x // cell), int(y // cell))].append((x, y))
+        self.build_levels()
+
+    def nearest(self, x, y):
+        """Return the projected distance from (x, y) to the nearest point."""
+        cells, cell = self.cells, self.cell
+        cx, cy = int(x // cell), int(y // cell)
+        best = math.inf
+        for ring in range(self.NEAR_RINGS + 1):
+            for gx in range(cx - ring, cx + ring + 1):
+                # Only the outline of the ring is new
+                step = 1 if gx in (cx - ring, cx + ring) else 2 * ring or 1
+                for gy in range(cy - ring, cy + ring + 1, step):
+                    best = closest_point(x, y, cells.get((gx, gy), ()), best)
+            # Points outside the rings searched so far are at least `edge` away
+            edge = min(x - (cx - ring) * cell, (cx + ring + 1) * cell - x,
+                       y - (cy - ring) * cell, (cy + ring + 1) * cell - y)
+            if best <= edge * edge:
+                return math.sqrt(best)
+        # Far from the points: go through the cells nearest first
+        for d2, points in self.cells_by_distance(x, y):
+            if d2 >= best:
+                break
+            best = closest_point(x, y, points, best)
+        return math.sqrt(best)
+
+
+def read_plan(plan_path):
+    """Return the planned lines, each a (lats, lons) pair, from a KML, KMZ or GPX file, gzipped or not.
+
+    Every KML LineString, GPX route and GPX track segment is a line of its
+    own: the gap between one day's plan and the next is not a segment.
+    """
+    import xml.etree.ElementTree as ET
+
+    from compressedFiles import base_extension, open_input
+
+    lines = []
+    if base_extension(plan_path) == '.gpx':
+        from convertGpx2Kml import parse_gpx
+
+        _, routes, tracks = parse_gpx(plan_path)
+        for line in [r['points'] for r in routes] + [seg for t in tracks for seg in t['segments']]:
+            lines.append(([float(lat) for _, lat, _ in line], [float(lon) for lon, _, _ in line]))
+    else:
+        from convertKml2Gpx import parse_kml_coordinates
+
+        ns = {"kml": "http://www.opengis.net/kml/2.2"}
+        with open_input(plan_path) as f:
+            root = ET.parse(f).getroot()
+        for coords in root.findall(".//kml:LineString/kml:coordinates", ns):
+            points = parse_kml_coordinates(coords.text or '')
+            lines.append(([lat for lat, _, _ in points], [lon for _, lon, _ in points]))
+    return [line for line in lines if len(line[0]) >= 2]
+
+
+def read_track(fit_file, error_log=None):
+    """Return (timestamps, lats, lons) of a recorded FIT file, skipping points without a fix."""
+    from fastFitDecoder import decode_record_columns
+    from units import degrees_column
+
+    columns = decode_record_columns(fit_file, ('timestamp', 'position_lat', 'position_long'), error_log)
+    if columns is None:
+        return [], [], []
+    keep = [i for i, (t, lat, lon) in enumerate(zip(columns['timestamp'], columns['position_lat'],
+                                                    columns['position_long']))
+            if t is not None and lat is not None and lon is not None]
+    return ([columns['timestamp'][i] for i in keep],
+            degrees_column([columns['position_lat'][i] for i in keep]),
+            degrees_column([columns['position_long'][i] for i in keep]))
+
+
+class PlannedRoute(object):
+    """A planned route projected and indexed once, for comparing any number of tracks."""
+
+    def __init__(self, lines, cell_meters=None):
+        """lines is a list of (lats, lons) pairs, as read_plan returns."""
+        self.lats = lats = [lat for line_lats, _ in lines for lat in line_lats]
+        self.lons = [lon for _, line_lons in lines for lon in line_lons]
+        self.xs, self.ys = mercator(lats, self.lons)
+        # Chainage runs on from the end of one line to the start of the next,
+        # so the distance between lines never counts as planned
+        self.chainage = []
+        self.line_of = []
+        self.line_spans = []
+        starts = []
+        for number, (line_lats, _) in enumerate(lines):
+            first = len(self.chainage)
+            last = first + len(line_lats)
+            offset = self.chainage[-1] if self.chainage else 0.0
+            self.chainage.extend(offset + d for d in path_lengths(self.xs[first:last], self.ys[first:last],
+                                                                  line_lats))
+            self.line_of.extend([number] * len(line_lats))
+            self.line_spans.append((offset, self.chainage[-1]))
+            starts.extend(range(first, last - 1))
+        cell = None
+        if cell_meters:
+            # Grid cells are in projected meters, which grow by 1 / cos(latitude)
+            cell = cell_meters / math.cos(math.radians((min(lats) + max(lats)) / 2))
+        with stage('index'):
+            self.index = SegmentIndex(self.xs, self.ys, starts, cell)
+
+    def compare(self, times, lats, lons, threshold=100.0, hint=None):
+        """Compare one recorded track with the plan; returns a report dict."""
+        xs, ys = mercator(lats, lons)
+        nearest = self.index.nearest
+        chainage = self.chainage
+        cos, radians = math.cos, math.radians
+        deviations = []
+        matches = []
+        fractions = []
+        for x, y, lat in zip(xs, ys, lats):
+            d, hint, t = nearest(x, y, hint)
+            deviations.append(d * cos(radians(lat)))
+            matches.append(hint)
+            fractions.append(t)
+        positions = [chainage[i] + t * (chainage[i + 1] - chainage[i]) for i, t in zip(matches, fractions)]
+
+        ridden = path_lengths(xs, ys, lats)
+        # The day runs from where it first joins the plan to where it last leaves it;
+        # crossing another stretch of the plan in between does not widen it
+        on_route = [p for p, d in zip(positions, deviations) if d <= threshold] or positions
+        start, end = sorted((on_route[0], on_route[-1]))
+        report = {
+            'points': len(lats),
+            'ridden_m': ridden[-1],
+            'planned_m': end - start,
+            'extra_m': ridden[-1] - (end - start),
+            'plan_start_m': start,
+            'plan_end_m': end,
+            'max_deviation_m': max(deviations),
+            'off_route_points': sum(1 for d in deviations if d > threshold),
+            'off_route': off_route_segments(times, lats, lons, deviations, ridden, threshold),
+        }
+        report['hausdorff_m'] = self._plan_to_track(xs, ys, ridden, deviations, positions, matches,
+                                                    start, end, report['max_deviation_m'])
+        return report, hint
+
+    def _plan_to_track(self, xs, ys, ridden, deviations, positions, matches, start, end, worst):
+        """Largest of worst and the distances from the plan vertices between
+        chainages start..end to their nearest track points.
+
+        A track point d meters from the plan is at most d plus the distance
+        along that line of the plan from any of its vertices. Only the
+        vertices this bound leaves farther than worst are looked up, in a
+        grid over the track points near them.
+        """
+        chainage, line_of = self.chainage, self.line_of
+        # A line only touching start..end where it meets the next is not part of the stretch
+        lines_in = [start == end or (first < end and last > start) for first, last in self.line_spans]
+        vertices = [v for v in range(bisect.bisect_left(chainage, start), bisect.bisect_right(chainage, end))
+                    if lines_in[line_of[v]]]
+        lines = [line_of[i] for i in matches]
+        order = sorted(range(len(positions)), key=positions.__getitem__)
+        bounds = {}
+        # Bound each vertex by the track points matched before it on its line, then after it
+        best, line, j = math.inf, None, 0
+        for v in vertices:
+            if line_of[v] != line:
+                best, line = math.inf, line_of[v]
+            while j < len(order) and positions[order[j]] <= chainage[v]:
+                k = order[j]
+                if lines[k] == line and deviations[k] - positions[k] < best:
+                    best = deviations[k] - positions[k]
+                j += 1
+            bounds[v] = best + chainage[v]
+        best, line, j = math.inf, None, len(order) - 1
+        for v in reversed(vertices):
+            if line_of[v] != line:
+                best, line = math.inf, line_of[v]
+            while j >= 0 and positions[order[j]] >= chainage[v]:
+                k = order[j]
+                if lines[k] == line and deviations[k] + positions[k] < best:
+                    best = deviations[k] + positions[k]
+                j -= 1
+            bounds[v] = min(bounds[v], best - chainage[v])
+
+        far = [v for v in vertices if bounds[v] > worst]
+        if not far:
+            return worst
+        # A far vertex's nearest track point is within its bound, so inside this box
+        cos, radians = math.cos, math.radians
+        margin = max(bounds[v] / cos(radians(self.lats[v])) for v in far) * 1.01
+        x0 = min(self.xs[v] for v in far) - margin
+        x1 = max(self.xs[v] for v in far) + margin
+        y0 = min(self.ys[v] for v in far) - margin
+        y1 = max(self.ys[v] for v in far) + margin
+        near = [(x, y) for x, y in zip(xs, ys) if x0 <= x <= x1 and y0 <= y <= y1] or list(zip(xs, ys))
+        step = ridden[-1] / max(len(xs) - 1, 1) / cos(radians(self.lats[far[0]]))
+        track_index = PointIndex([x for x, _ in near], [y for _, y in near], 4 * step or 1.0)
+        for v in far:
+            worst = max(worst, track_index.nearest(self.xs[v], self.ys[v]) * cos(radians(self.lats[v])))
+        return worst
+
+
+def off_route_segments(times, lats, lons, deviations, ridden, threshold):
+    """Group consecutive points farther than threshold from the plan into segments."""
+    segments = []
+    first = None
+    for i, d in enumerate(deviations + [0.0]):
+        if d > threshold and first is None:
+            first = i
+        elif d <= threshold and first is not None:
+            last = i - 1
+            segments.append({
+                'start_time': times[first],
+                'end_time': times[last],
+                'start': [lats[first], lons[first]],
+                'end': [lats[last], lons[last]],
+                'length_m': ridden[last] - ridden[first],
+                'max_deviation_m': max(deviations[first:last + 1]),
+            })
+            first = None
+    return segments
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the recorded rides with a planned KML/GPX route.")
+    parser.add_argument("--plan", required=True,
+                        help="Planned route (.kml or .gpx)")
+    parser.add_argument("--fitDir", default="./fitData",
+                        help="Directory of recorded FIT files (default: ./fitData)")
+    parser.add_argument("--fit", action="append",
+                        help="Compare only this FIT file (repeatable)")
+    parser.add_argument("--threshold", type=float, default=100.0,
+                        help="Meters from the plan before a point counts as off route (default: 100)")
+    parser.add_argument("--cellSize", type=float,
+                        help="Grid cell size of the plan's spatial index in meters "
+                             "(default: twice the plan's mean segment length)")
+    parser.add_argument("--output", default="route_comparison.json",
+                        help="JSON report (default: route_comparison.json)")
+    args, _ = parser.parse_known_args(argv)
+
+    from buildSummaryFile import get_fit_files
+    from safeFitFile import write_error_log
+
+    with stage('read_plan'):
+        lines = read_plan(args.plan)
+    if not lines:
+        print(f"No route found in {args.plan}")
+        return
+    plan = PlannedRoute(lines, args.cellSize)
+    print(f"Plan {os.path.basename(args.plan)}: {len(lines)} line(s), {len(plan.lats)} points, "
+          f"{plan.chainage[-1] / 1000:.1f} km")
+
+    error_log = []
+    reports = []
+    hint = None
+    for fit_file in args.fit or get_fit_files(args.fitDir):
+        with stage('read_track'):
+            times, lats, lons = read_track(fit_file, error_log)
+        if not lats:
+            print(f"{os.path.basename(fit_file)}: no positions")
+            continue
+        with stage('compare'):
+            report, hint = plan.compare(times, lats, lons, args.threshold, hint)
+        report['file'] = os.path.basename(fit_file)
+        reports.append(report)
+        print(f"{report['file']}: ridden {report['ridden_m'] / 1000:.2f} km, "
+              f"planned {report['planned_m'] / 1000:.2f} km, extra {report['extra_m'] / 1000:+.2f} km, "
+              f"hausdorff {report['hausdorff_m']:.0f} m, "
+              f"{len(report['off_route'])} off-route segment(s)")
+        for segment in report['off_route']:
+            print(f"    off route {segment['length_m'] / 1000:.2f} km, up to "
+                  f"{segment['max_deviation_m']:.0f} m away, from {segment['start'][0]:.5f},{segment['start'][1]:.5f}")
+
+    with stage('write'), open(args.output, 'w') as f:
+        json.dump({'plan': args.plan, 'threshold_m': args.threshold, 'days': reports}, f, indent=4)
+    print(f"Comparison written to {args.output}")
+    write_error_log(error_log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Transparent gzip and KMZ reading and writing for route files.
+
+Inputs are recognised by their first bytes, so a gzip file or a KMZ reads
+the same as plain KML, GPX or FIT whatever its name. Outputs are chosen by
+extension: `.gz` is gzip and `.kmz` is a zip holding doc.kml. Writes go
+through the compressor as they are produced.
+"""
+
+import os
+import re
+import time
+from contextlib import contextmanager
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'
+KMZ_DOCUMENT = 'doc.kml'
+
+
+def kmz_document(archive):
+    """Name of the KML document in a KMZ: doc.kml, else its first .kml entry."""
+    names = archive.namelist()
+    if KMZ_DOCUMENT in names:
+        return KMZ_DOCUMENT
+    for name in names:
+        if name.lower().endswith('.kml'):
+            return name
+    raise ValueError(f"No KML document in {archive.filename}")
+
+
+@contextmanager
+def open_input(path):
+    """Open a file for binary reading, decompressing gzip and KMZ files.
+
+    Damaged compressed data raises OSError, as a failed read of a plain file does.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    # gzip and zipfile are loaded only for compressed files, keeping them off plain reads and --help
+    if magic.startswith(GZIP_MAGIC):
+        import gzip
+        import zlib
+
+        with gzip.open(path, 'rb') as f:
+            try:
+                yield f
+            except (zlib.error, EOFError) as e:
+                raise OSError(f"Damaged gzip data in {path}: {e}") from e
+    elif magic == ZIP_MAGIC:
+        import zipfile
+        import zlib
+
+        try:
+            archive = zipfile.ZipFile(path)
+        except zipfile.BadZipFile as e:
+            raise OSError(f"Damaged zip file {path}: {e}") from e
+        with archive:
+            try:
+                name = kmz_document(archive)
+            except ValueError as e:
+                raise OSError(str(e)) from e
+            with archive.open(name) as f:
+                try:
+                    yield f
+                except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                    raise OSError(f"Damaged zip data in {path}: {e}") from e
+    else:
+        with open(path, 'rb') as f:
+            yield f
+
+
+def read_bytes(path):
+    with open_input(path) as f:
+        return f.read()
+
+
+@contextmanager
+def open_output(path):
+    """Open a file for binary writing, compressing it if it ends in .gz or .kmz."""
+    lower = path.lower()
+    if lower.endswith('.gz'):
+        import gzip
+
+        with gzip.open(path, 'wb') as f:
+            yield f
+    elif lower.endswith('.kmz'):
+        import zipfile
+
+        info = zipfile.ZipInfo(KMZ_DOCUMENT, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(path, 'w') as archive, archive.open(info, 'w') as f:
+            yield f
+    else:
+        with open(path, 'wb') as f:
+            yield f
+
+
+def base_extension(path):
+    """Extension of a path ignoring a trailing .gz, with .kmz reported as .kml."""
+    lower = path.lower()
+    if lower.endswith('.gz'):
+        lower = lower[:-3]
+    if lower.endswith('.kmz'):
+        return '.kml'
+    return lower[lower.rfind('.'):] if '.' in lower else ''
+
+
+def is_fit_file(name):
+    """Whether a file name is a FIT file: .fit or .fit.gz, in any case."""
+    return base_extension(name) == '.fit'
+
+
+def list_fit_files(directory):
+    """Paths of the FIT files in a directory, plain or gzipped, unsorted."""
+    return [os.path.join(directory, name) for name in os.listdir(directory) if is_fit_file(name)]
+
+
+def coordinate_formatter(precision=None):
+    """Return a function formatting a coordinate with at most `precision` decimals.
+
+    Without a precision values are written as they are.
+    """
+    if precision is None:
+        return str
+
+    def format_coordinate(value):
+        text = f"{float(value):.{precision}f}"
+        return text.rstrip('0').rstrip('.') if '.' in text else text
+
+    return format_coordinate
+
+
+def add_precision_argument(parser):
+    parser.add_argument("--precision", type=int, metavar="DIGITS",
+                        help="Decimals kept in coordinates, and 0.0 altitudes dropped "
+                             "(default: written as they are; 6 is about 0.1 m)")
+
+
+# simplekml writes 2D points with a 0.0 altitude
+_COORDINATE = re.compile(r'(-?\d+\.\d+),(-?\d+\.\d+),0\.0\b')
+
+# Characters of the KML text rewritten and encoded at a time
+WRITE_CHUNK = 1 << 20
+
+
+def save_kml(kml, path, precision=None):
+    """Save a simplekml document to .kml, .kml.gz or .kmz, optionally with compact coordinates.
+
+    simplekml only builds the document as one string. It is rewritten,
+    encoded and written a chunk at a time, so no second full copy is made.
+    """
+    text = kml.kml()
+    fmt = coordinate_formatter(precision) if precision is not None else None
+    with open_output(path) as f:
+        start = 0
+        while start < len(text):
+            end = start + WRITE_CHUNK
+            if end < len(text):
+                # Cut on whitespace so no coordinate is split between chunks
+                cut = max(text.rfind(' ', start, end), text.rfind('\n', start, end))
+                if cut > start:
+                    end = cut
+            chunk = text[start:end]
+            if fmt is not None:
+                chunk = _COORDINATE.sub(lambda m: f"{fmt(m.group(1))},{fmt(m.group(2))}", chunk)
+            f.write(chunk.encode('utf-8'))
+            start = end
@@ -5,24 +5,22 @@ gpx_to_kml.py
 Convert a GPX file to a KML file.
 
 Usage:
-    python gpx_to_kml.py --inputGpx my.gpx --outputKml my.kml
+    python gpx_to_kml.py --inputGpx my.gpx --outputKml my.kml [--precision 6]
+
+Gzipped GPX input is read as is; a .kmz or .kml.gz output is compressed.
 """
 
 import argparse
 import os
 import sys
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
-
-
-def prettify_xml(elem):
-    rough_string = ET.tostring(elem, "utf-8")
-    reparsed = minidom.parseString(rough_string)
-    return reparsed.toprettyxml(indent="  ")
+from runReport import stage
+from compressedFiles import open_input, open_output, coordinate_formatter, add_precision_argument
 
 
 def parse_gpx(gpx_path):
-    tree = ET.parse(gpx_path)
+    with open_input(gpx_path) as f:
+        tree = ET.parse(f)
     root = tree.getroot()
 
     ns = {}
@@ -93,7 +91,16 @@ def parse_gpx(gpx_path):
     return waypoints, routes, tracks
 
 
-def build_kml(waypoints, routes, tracks, document_name="GPX to KML"):
+def build_kml(waypoints, routes, tracks, document_name="GPX to KML", precision=None):
+    fmt = coordinate_formatter(precision)
+
+    def coordinate(lon, lat, ele):
+        if precision is not None:
+            lon, lat = fmt(lon), fmt(lat)
+            if ele and float(ele) == 0.0:
+                ele = None
+        return f"{lon},{lat},{ele}" if ele else f"{lon},{lat}"
+
     kml_ns = "http://www.opengis.net/kml/2.2"
     ET.register_namespace("", kml_ns)
 
@@ -112,9 +119,7 @@ def build_kml(waypoints, routes, tracks, document_name="GPX to KML"):
 
         point = ET.SubElement(pm, "Point")
         coords = ET.SubElement(point, "coordinates")
-        coords.text = (
-            f"{w['lon']},{w['lat']},{w['ele']}" if w["ele"] else f"{w['lon']},{w['lat']}"
-        )
+        coords.text = coordinate(w["lon"], w["lat"], w["ele"])
 
     # Routes
     for r in routes:
@@ -127,11 +132,7 @@ def build_kml(waypoints, routes, tracks, document_name="GPX to KML"):
         ET.SubElement(ls, "tessellate").text = "1"
         coords = ET.SubElement(ls, "coordinates")
 
-        coord_strings = [
-            f"{lon},{lat},{ele}" if ele else f"{lon},{lat}"
-            for lon, lat, ele in r["points"]
-        ]
-        coords.text = " ".join(coord_strings)
+        coords.text = " ".join(coordinate(lon, lat, ele) for lon, lat, ele in r["points"])
 
     # Tracks
     for t in tracks:
@@ -150,21 +151,19 @@ def build_kml(waypoints, routes, tracks, document_name="GPX to KML"):
             ET.SubElement(ls, "tessellate").text = "1"
             coords = ET.SubElement(ls, "coordinates")
 
-            coord_strings = [
-                f"{lon},{lat},{ele}" if ele else f"{lon},{lat}" for lon, lat, ele in seg
-            ]
-            coords.text = " ".join(coord_strings)
+            coords.text = " ".join(coordinate(lon, lat, ele) for lon, lat, ele in seg)
 
     return kml
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Convert GPX to KML.")
     parser.add_argument("--inputGpx", default="input.gpx",
                         help="Input GPX file (default: input.gpx)")
     parser.add_argument("--outputKml", default="output.kml",
-                        help="Output KML file (default: output.kml)")
-    args, unknown = parser.parse_known_args()
+                        help="Output KML file; .kmz or .kml.gz is compressed (default: output.kml)")
+    add_precision_argument(parser)
+    args, unknown = parser.parse_known_args(argv)
 
     input_gpx = args.inputGpx
     output_kml = args.outputKml
@@ -173,14 +172,16 @@ def main():
         print(f"Error: input file not found: {input_gpx}")
         sys.exit(1)
 
-    waypoints, routes, tracks = parse_gpx(input_gpx)
+    with stage("parse"):
+        waypoints, routes, tracks = parse_gpx(input_gpx)
     doc_name = os.path.basename(input_gpx)
 
-    kml_elem = build_kml(waypoints, routes, tracks, document_name=doc_name)
-    kml_str = prettify_xml(kml_elem)
-
-    with open(output_kml, "w", encoding="utf-8") as f:
-        f.write(kml_str)
+    with stage("build_kml"):
+        kml_elem = build_kml(waypoints, routes, tracks, document_name=doc_name, precision=args.precision)
+    # Serialized straight into the (possibly compressed) output instead of a pretty-printed copy
+    with stage("write"), open_output(output_kml) as f:
+        ET.indent(kml_elem)
+        ET.ElementTree(kml_elem).write(f, encoding="utf-8", xml_declaration=True)
 
     print(f"Converted {input_gpx} → {output_kml}")
 
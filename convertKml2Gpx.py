@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 import argparse
 import xml.etree.ElementTree as ET
+from runReport import stage
+from compressedFiles import open_input, open_output, coordinate_formatter, add_precision_argument
 
 def parse_kml_coordinates(coord_text):
     coords = []
@@ -12,11 +14,13 @@ def parse_kml_coordinates(coord_text):
             coords.append((lat, lon, ele))
     return coords
 
-def kml_to_gpx(input_kml, output_gpx):
-    # Parse KML
+def kml_to_gpx(input_kml, output_gpx, precision=None):
+    # Parse KML; .kmz and gzipped files are read the same way
     ns = {"kml": "http://www.opengis.net/kml/2.2"}
-    tree = ET.parse(input_kml)
+    with stage("parse"), open_input(input_kml) as f:
+        tree = ET.parse(f)
     root = tree.getroot()
+    fmt = coordinate_formatter(precision)
 
     gpx = ET.Element("gpx", {
         "version": "1.1",
@@ -35,8 +39,8 @@ def kml_to_gpx(input_kml, output_gpx):
             coords = parse_kml_coordinates(point.text)
             if coords:
                 lat, lon, ele = coords[0]
-                wpt = ET.SubElement(gpx, "wpt", {"lat": str(lat), "lon": str(lon)})
-                if ele is not None:
+                wpt = ET.SubElement(gpx, "wpt", {"lat": fmt(lat), "lon": fmt(lon)})
+                if ele is not None and not (precision is not None and ele == 0.0):
                     ET.SubElement(wpt, "ele").text = str(ele)
                 ET.SubElement(wpt, "name").text = name
             continue
@@ -50,22 +54,24 @@ def kml_to_gpx(input_kml, output_gpx):
             trkseg = ET.SubElement(trk, "trkseg")
 
             for lat, lon, ele in coords:
-                trkpt = ET.SubElement(trkseg, "trkpt", {"lat": str(lat), "lon": str(lon)})
-                if ele is not None:
+                trkpt = ET.SubElement(trkseg, "trkpt", {"lat": fmt(lat), "lon": fmt(lon)})
+                if ele is not None and not (precision is not None and ele == 0.0):
                     ET.SubElement(trkpt, "ele").text = str(ele)
             continue
 
-    # Write GPX file
-    ET.indent(gpx)
-    ET.ElementTree(gpx).write(output_gpx, encoding="utf-8", xml_declaration=True)
+    # Write GPX file, streaming through gzip for .gpx.gz
+    with stage("write"), open_output(output_gpx) as f:
+        ET.indent(gpx)
+        ET.ElementTree(gpx).write(f, encoding="utf-8", xml_declaration=True)
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Convert KML to GPX")
-    parser.add_argument("--inputKml", help="Input KML file", default="us_ride_detail.kml")
-    parser.add_argument("--outputGpx", help="Output GPX file", default="output.gpx")
-    args, _ = parser.parse_known_args()   # Ignore any extra args
+    parser.add_argument("--inputKml", help="Input KML or KMZ file", default="us_ride_detail.kml")
+    parser.add_argument("--outputGpx", help="Output GPX file (.gpx.gz is gzipped)", default="output.gpx")
+    add_precision_argument(parser)
+    args, _ = parser.parse_known_args(argv)   # Ignore any extra args
 
-    kml_to_gpx(args.inputKml, args.outputGpx)
+    kml_to_gpx(args.inputKml, args.outputGpx, args.precision)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,20 +1,191 @@
+#!/usr/bin/env python3
+"""
+convertToGpx.py
 
-import os
+Convert every FIT file in ./fitData to GPX in ./gpxData.
+
+Usage:
+    python convertToGpx.py [--fitDir ./fitData] [--gpxDir ./gpxData] [--recursive]
+                           [--workers N] [--check mtime|hash] [--force]
+
+Files are converted in parallel. A GPX is first written to a temporary
+file in the output directory and renamed into place once complete, so an
+interrupted run never leaves a truncated GPX behind. Every result is
+recorded in <gpxDir>/conversion_manifest.json, saved every few seconds
+and when the run stops. A later run skips the files whose GPX is up to
+date: with --check mtime the FIT file's modification time and size are
+unchanged, with --check hash its content.
+"""
+
+import argparse
 import glob
-from fit2gpx import Converter
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from runReport import stage
+
+MANIFEST = 'conversion_manifest.json'
+SAVE_INTERVAL = 5.0
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(gpx_dir):
+    path = os.path.join(gpx_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'version': 1, 'files': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(gpx_dir, manifest):
+    path = os.path.join(gpx_dir, MANIFEST)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp, path)
+
+
+def find_fit_files(fit_dir, recursive=False):
+    """Return FIT paths relative to fit_dir, sorted."""
+    pattern = os.path.join('**', '*.fit') if recursive else '*.fit'
+    return sorted(os.path.relpath(path, fit_dir)
+                  for path in glob.glob(os.path.join(fit_dir, pattern), recursive=recursive))
+
+
+def gpx_name(fit_name):
+    return os.path.splitext(fit_name)[0] + '.gpx'
+
 
-fit_dir = './fitData'
-gpx_dir = './gpxData'
-os.makedirs(gpx_dir, exist_ok=True)
+def is_up_to_date(entry, fit_path, gpx_path, check, digest=None):
+    """Whether gpx_path is a finished conversion of the FIT file as it is now.
 
-fit_files = glob.glob(os.path.join(fit_dir, '*.fit'))
+    A GPX with no manifest entry is converted again: it may be a truncated
+    file from a run that wrote it in place.
+    """
+    if entry is None or entry.get('status') != 'ok' or not os.path.exists(gpx_path):
+        return False
+    if check == 'hash' and entry.get('sha1'):
+        return entry['sha1'] == digest
+    st = os.stat(fit_path)
+    return entry.get('stamp') == [st.st_mtime, st.st_size]
 
-for fit_file in fit_files:
-    base_name = os.path.splitext(os.path.basename(fit_file))[0]
-    gpx_file = os.path.join(gpx_dir, base_name + '.gpx')
-    print(f"Converting {fit_file} -> {gpx_file}")
+
+def current_umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def convert_file(fit_path, gpx_path):
+    """Convert one FIT file, renaming the GPX into place only once it is complete.
+
+    Runs in a worker process. Returns a result dict for the manifest.
+    """
+    from fit2gpx import Converter
+
+    start = time.perf_counter()
+    directory = os.path.dirname(gpx_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(gpx_path) + '.', suffix='.tmp')
+    os.close(fd)
     try:
-        converter = Converter(input_file_path=fit_file)
-        converter.to_gpx(gpx_file)
+        converter = Converter(input_file_path=fit_path)
+        converter.to_gpx(tmp)
+        # mkstemp creates the file owner-only; give the GPX the mode a plain open() would
+        os.chmod(tmp, 0o666 & ~current_umask())
+        os.replace(tmp, gpx_path)
+        result = {'status': 'ok'}
     except Exception as e:
-        print(f"Failed to convert {fit_file}: {e}")
+        result = {'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert every FIT file in ./fitData to GPX.")
+    parser.add_argument("--fitDir", default="./fitData",
+                        help="Directory of FIT files (default: ./fitData)")
+    parser.add_argument("--gpxDir", default="./gpxData",
+                        help="Directory for the GPX files (default: ./gpxData)")
+    parser.add_argument("--recursive", action="store_true",
+                        help="Also convert FIT files in subdirectories, keeping the layout")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Files converted in parallel (default: number of CPUs)")
+    parser.add_argument("--check", choices=('mtime', 'hash'), default='mtime',
+                        help="How to tell a FIT file changed since its GPX was written (default: mtime)")
+    parser.add_argument("--force", action="store_true",
+                        help="Convert every file even if its GPX is up to date")
+    args, _ = parser.parse_known_args(argv)
+
+    fit_dir = args.fitDir
+    gpx_dir = args.gpxDir
+    os.makedirs(gpx_dir, exist_ok=True)
+    manifest = load_manifest(gpx_dir)
+    entries = manifest['files']
+
+    todo = []
+    with stage('scan'):
+        names = find_fit_files(fit_dir, args.recursive)
+        for name in names:
+            fit_path = os.path.join(fit_dir, name)
+            gpx_path = os.path.join(gpx_dir, gpx_name(name))
+            st = os.stat(fit_path)
+            digest = file_hash(fit_path) if args.check == 'hash' else None
+            if not args.force and is_up_to_date(entries.get(name), fit_path, gpx_path, args.check, digest):
+                # A touched but unchanged file keeps its GPX under --check hash
+                entries[name]['stamp'] = [st.st_mtime, st.st_size]
+                entries[name]['sha1'] = digest or entries[name].get('sha1')
+                continue
+            todo.append((name, fit_path, gpx_path, [st.st_mtime, st.st_size], digest))
+    print(f"{len(todo)} file(s) to convert, {len(names) - len(todo)} up to date")
+
+    saved = time.monotonic()
+
+    def record(name, stamp, digest, result):
+        nonlocal saved
+        entries[name] = dict(output=gpx_name(name), stamp=stamp, sha1=digest, **result)
+        if result['status'] == 'ok':
+            print(f"Converted {name} -> {entries[name]['output']} ({result['seconds']:.1f}s)")
+        else:
+            print(f"Failed to convert {name}: {result['error']}")
+        # Saved every few seconds so a killed run loses only the last few records
+        if time.monotonic() - saved > SAVE_INTERVAL:
+            save_manifest(gpx_dir, manifest)
+            saved = time.monotonic()
+
+    try:
+        with stage('convert'):
+            if args.workers > 1 and len(todo) > 1:
+                from concurrent.futures import ProcessPoolExecutor, as_completed
+
+                with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                    futures = {pool.submit(convert_file, fit_path, gpx_path): (name, stamp, digest)
+                               for name, fit_path, gpx_path, stamp, digest in todo}
+                    for future in as_completed(futures):
+                        record(*futures[future], future.result())
+            else:
+                for name, fit_path, gpx_path, stamp, digest in todo:
+                    record(name, stamp, digest, convert_file(fit_path, gpx_path))
+    finally:
+        save_manifest(gpx_dir, manifest)
+
+    failed = [name for name, entry in entries.items() if entry['status'] != 'ok']
+    print(f"Manifest written to {os.path.join(gpx_dir, MANIFEST)}"
+          + (f"; {len(failed)} file(s) failed" if failed else ""))
+
+
+if __name__ == "__main__":
+    main()
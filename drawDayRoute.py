@@ -1,47 +1,100 @@
 
-import json
+import argparse
+import re
+from runReport import stage
+from archiveArguments import add_archive_arguments
+from compressedFiles import open_output
 
-def create_kml_from_summary(summary_path, kml_output_path):
-    with open(summary_path, 'r') as f:
-        data = json.load(f)
-
-    kml_header = '''<?xml version="1.0" encoding="UTF-8"?>
+KML_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
 <kml xmlns="http://www.opengis.net/kml/2.2">
 <Document>
     <name>Ride Start Locations</name>
 '''
-    kml_footer = '</Document>\n</kml>'
+KML_FOOTER = '</Document>\n</kml>'
+
+
+def point_placemark(name, lat, lon):
+    return f'''    <Placemark>\n        <name>{name}</name>\n        <Point>\n            <coordinates>{lon},{lat},0</coordinates>\n        </Point>\n    </Placemark>\n'''
 
+def start_placemark(record):
+    fit_name = record.fit_file_name
+    # Skip if this is a Part file but not Part_1
+    if 'Part' in fit_name and 'Part_1' not in fit_name:
+        return None
+    lat = record.start_position_lat
+    lon = record.start_position_long
+    # Extract just the day number
+    match = re.search(r'Day_(\d+)', fit_name)
+    day_num = match.group(1) if match else fit_name
+    if lat is not None and lon is not None:
+        return point_placemark(day_num, f"{lat:.6f}", f"{lon:.6f}")
+    return None
+
+def end_placemark(record):
+    end_lat = record.end_position_lat
+    end_lon = record.end_position_long
+    if end_lat is not None and end_lon is not None:
+        return point_placemark('End', f"{end_lat:.6f}", f"{end_lon:.6f}")
+    return None
+
+def labelled_start_placemark(record, label):
+    # An archive names its days itself; None means the record starts no day
+    if label is None or record.start_position_lat is None or record.start_position_long is None:
+        return None
+    return point_placemark(label, f"{record.start_position_lat:.6f}", f"{record.start_position_long:.6f}")
+
+def write_start_kml(records, kml_output_path, labels=None):
     placemarks = []
-    for idx, record in enumerate(data):
-        fit_name = record.get('fitFileName', '')
-        # Skip if this is a Part file but not Part_1
-        if 'Part' in fit_name and 'Part_1' not in fit_name:
-            continue
-        lat = record.get('start_position_lat')
-        lon = record.get('start_position_long')
-        # Extract just the day number
-        import re
-        match = re.search(r'Day_(\d+)', fit_name)
-        day_num = match.group(1) if match else fit_name
-        if lat and lon:
-            placemark = f'''    <Placemark>\n        <name>{day_num}</name>\n        <Point>\n            <coordinates>{lon},{lat},0</coordinates>\n        </Point>\n    </Placemark>\n'''
+    for i, record in enumerate(records):
+        if labels is None:
+            placemark = start_placemark(record)
+        else:
+            placemark = labelled_start_placemark(record, labels[i])
+        if placemark:
             placemarks.append(placemark)
 
     # Add the final 'End' placemark using the last record's end_position_lat/long
-    if data:
-        last = data[-1]
-        end_lat = last.get('end_position_lat')
-        end_lon = last.get('end_position_long')
-        if end_lat and end_lon:
-            end_placemark = f'''    <Placemark>\n        <name>End</name>\n        <Point>\n            <coordinates>{end_lon},{end_lat},0</coordinates>\n        </Point>\n    </Placemark>\n'''
-            placemarks.append(end_placemark)
-
-    with open(kml_output_path, 'w') as f:
-        f.write(kml_header)
+    if records:
+        placemark = end_placemark(records[-1])
+        if placemark:
+            placemarks.append(placemark)
+
+    with stage('write'), open_output(kml_output_path) as f:
+        f.write(KML_HEADER.encode('utf-8'))
         for placemark in placemarks:
-            f.write(placemark)
-        f.write(kml_footer)
+            f.write(placemark.encode('utf-8'))
+        f.write(KML_FOOTER.encode('utf-8'))
+
+def create_kml_from_summary(summary_path, kml_output_path):
+    from summaryRecord import load_summary_json
+
+    with stage('read_summary'):
+        data = load_summary_json(summary_path)
+    write_start_kml(data, kml_output_path)
+
+def create_kml_from_db(db_path, kml_output_path):
+    from rideDatabase import load_summary_records
+
+    with stage('read_summary'):
+        data = load_summary_records(db_path)
+    write_start_kml(data, kml_output_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Draw ride start locations from summary.json.")
+    parser.add_argument("--summary", default="summary.json",
+                        help="Summary JSON file (default: summary.json)")
+    parser.add_argument("--db",
+                        help="Read the summaries from this SQLite export (see rideDatabase.py) instead")
+    parser.add_argument("--outputKml", default="ride_start_locations.kml",
+                        help="Output KML file; .kmz or .kml.gz is compressed (default: ride_start_locations.kml)")
+    add_archive_arguments(parser)
+    args, _ = parser.parse_known_args(argv)
+    if args.archive:
+        from rideArchive import run_from_args
+        return run_from_args(args, ['start'])
+    if args.db:
+        return create_kml_from_db(args.db, args.outputKml)
+    create_kml_from_summary(args.summary, args.outputKml)
 
 if __name__ == "__main__":
-    create_kml_from_summary('summary.json', 'ride_start_locations.kml')
+    main()
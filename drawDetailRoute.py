@@ -1,14 +1,21 @@
 import os
 import re
-from fitparse import FitFile
-import simplekml
+import argparse
+from safeFitFile import open_fit_file, write_error_log
+from fastFitDecoder import fast_latlon_every_n_seconds
+from runReport import stage
+from units import degrees_column
+from compressedFiles import add_precision_argument, list_fit_files, save_kml
+from archiveArguments import add_archive_arguments
 from datetime import timedelta
 
+DESCRIPTION = "Draw the route sampled every 10 minutes."
+
 def extract_order_key(filename):
     # Handles Day_XX[_Part_Y].fit robustly
     base = os.path.basename(filename)
     # Accept both .fit and .FIT
-    match = re.match(r"Day_(\d+)(?:_Part_(\d+))?\.fit$", base, re.IGNORECASE)
+    match = re.match(r"Day_(\d+)(?:_Part_(\d+))?\.fit(?:\.gz)?$", base, re.IGNORECASE)
     if match:
         day = int(match.group(1))
         part = int(match.group(2)) if match.group(2) else 0
@@ -16,12 +23,13 @@ def extract_order_key(filename):
     return (float('inf'), float('inf'))
 
 def fit_files_in_order(fit_dir):
-    files = [os.path.join(fit_dir, f) for f in os.listdir(fit_dir) if f.endswith('.fit')]
+    files = list_fit_files(fit_dir)
     files.sort(key=extract_order_key)
     return files
 
 def fit_latlon_every_n_minutes(fitfile, minutes=10):
-    points = []
+    lats = []
+    lons = []
     last_time = None
     for record in fitfile.get_messages('record'):
         lat = None
@@ -35,39 +43,64 @@ def fit_latlon_every_n_minutes(fitfile, minutes=10):
             elif field.name == 'timestamp':
                 timestamp = field.value
         if lat is not None and lon is not None and timestamp is not None:
-            # Convert semicircles to degrees
-            lat_deg = lat * (180.0 / 2147483648.0)
-            lon_deg = lon * (180.0 / 2147483648.0)
             if last_time is None or (timestamp - last_time) >= timedelta(minutes=minutes):
-                points.append((lat_deg, lon_deg))
+                lats.append(lat)
+                lons.append(lon)
                 last_time = timestamp
-    return points
+    # Convert semicircles to degrees a column at a time
+    return list(zip(degrees_column(lats), degrees_column(lons)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("--fast", action="store_true",
+                        help="Decode only the needed record fields with precompiled struct unpacking")
+    parser.add_argument("--output", default="us_ride_detail.kml",
+                        help="Output KML file; .kmz or .kml.gz is compressed (default: us_ride_detail.kml)")
+    add_precision_argument(parser)
+    add_archive_arguments(parser)
+    args, _ = parser.parse_known_args(argv)
+    if args.archive:
+        from rideArchive import run_from_args
+        return run_from_args(args, ['route'])
+    fast = args.fast
+
+    import simplekml
 
-def main():
     fit_dir = './fitData'
-    out_kml = 'us_ride_detail.kml'
+    out_kml = args.output
     files = fit_files_in_order(fit_dir)
     print("Sorted order:")
     for f in files:
         print(f)
     kml = simplekml.Kml()
     all_points = []
+    error_log = []
     for fit_path in files:
         print(f"Processing {fit_path}")
         try:
-            fitfile = FitFile(fit_path)
-            points = fit_latlon_every_n_minutes(fitfile, minutes=10)
+            if fast:
+                points = fast_latlon_every_n_seconds(fit_path, seconds=10 * 60, error_log=error_log)
+            else:
+                # Keeps whatever was recorded before a corrupt block instead of dropping the day
+                fitfile = open_fit_file(fit_path, error_log)
+                if fitfile is None:
+                    continue
+                with stage('sample'):
+                    points = fit_latlon_every_n_minutes(fitfile, minutes=10)
             all_points.extend(points)
         except Exception as e:
             print(f"Failed to process {fit_path}: {e}")
     if all_points:
-        ls = kml.newlinestring(name="US Ride Detail", coords=[(lon, lat) for lat, lon in all_points])
-        ls.style.linestyle.width = 4
-        ls.style.linestyle.color = simplekml.Color.red
-        kml.save(out_kml)
+        with stage('build_kml'):
+            ls = kml.newlinestring(name="US Ride Detail", coords=[(lon, lat) for lat, lon in all_points])
+            ls.style.linestyle.width = 4
+            ls.style.linestyle.color = simplekml.Color.red
+        with stage('write'):
+            save_kml(kml, out_kml, args.precision)
         print(f"KML file written to {out_kml}")
     else:
         print("No points found.")
+    write_error_log(error_log)
 
 if __name__ == "__main__":
     main()
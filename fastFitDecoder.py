@@ -0,0 +1,218 @@
+import os
+import struct
+import time
+import calendar
+from functools import lru_cache
+from safeFitFile import check_fit_bytes, open_fit_file
+from runReport import stage, count_file
+from compressedFiles import read_bytes
+from units import degrees_column
+
+# Seconds between the Unix epoch and the FIT epoch (1989-12-31 00:00:00 UTC)
+FIT_EPOCH = 631065600
+
+RECORD_MESG_NUM = 20
+
+# Record fields the fast path knows how to decode:
+# name -> (field number, struct code, invalid value, scale, offset)
+# enhanced_speed and enhanced_altitude are left to fitparse, which fills them
+# in from speed and altitude when a file only stores those.
+RECORD_FIELDS = {
+    'timestamp': (253, 'I', 0xFFFFFFFF, 1, 0),
+    'position_lat': (0, 'i', 0x7FFFFFFF, 1, 0),
+    'position_long': (1, 'i', 0x7FFFFFFF, 1, 0),
+    'altitude': (2, 'H', 0xFFFF, 5, 500),
+    'heart_rate': (3, 'B', 0xFF, 1, 0),
+    'cadence': (4, 'B', 0xFF, 1, 0),
+    'distance': (5, 'I', 0xFFFFFFFF, 100, 0),
+    'speed': (6, 'H', 0xFFFF, 1000, 0),
+    'temperature': (13, 'b', 0x7F, 1, 0),
+}
+
+HOT_FIELDS = ('timestamp', 'position_lat', 'position_long', 'temperature', 'distance')
+
+
+class FastDecodeUnsupported(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def _compile_definition(global_mesg_num, endian, field_bytes, dev_data_size, fields):
+    """Build the unpacker for one definition message, once per distinct layout.
+
+    Returns (message size, struct or None, names unpacked, names missing).
+    """
+    fmt = endian
+    names = []
+    for i in range(0, len(field_bytes), 3):
+        num, size, _ = field_bytes[i:i + 3]
+        name = None
+        if global_mesg_num == RECORD_MESG_NUM:
+            name = next((f for f in fields if RECORD_FIELDS[f][0] == num), None)
+        if name is not None:
+            code = RECORD_FIELDS[name][1]
+            if struct.calcsize('<' + code) != size:
+                raise FastDecodeUnsupported(f"{name} stored in {size} bytes")
+            fmt += code
+            names.append(name)
+        else:
+            fmt += f'{size}x'
+    fmt += f'{dev_data_size}x'
+    size = struct.calcsize(fmt)
+    if global_mesg_num != RECORD_MESG_NUM:
+        return size, None, (), ()
+    missing = tuple(f for f in fields if f not in names)
+    return size, struct.Struct(fmt), tuple(names), missing
+
+
+def _decode(data, header_size, data_size, fields, health):
+    columns = {name: [] for name in fields}
+    definitions = {}
+    pos = header_size
+    end = min(header_size + data_size, len(data))
+    while pos < end:
+        header = data[pos]
+        if header & 0x80:
+            raise FastDecodeUnsupported("compressed timestamp header")
+        local_mesg_num = header & 0x0F
+        if header & 0x40:
+            if pos + 6 > end:
+                break
+            endian = '>' if data[pos + 2] else '<'
+            global_mesg_num = struct.unpack_from(endian + 'H', data, pos + 3)[0]
+            num_fields = data[pos + 5]
+            field_bytes = data[pos + 6:pos + 6 + 3 * num_fields]
+            pos += 6 + 3 * num_fields
+            dev_data_size = 0
+            if header & 0x20:
+                if pos >= end:
+                    break
+                num_dev_fields = data[pos]
+                dev_data_size = sum(data[pos + 2:pos + 1 + 3 * num_dev_fields:3])
+                pos += 1 + 3 * num_dev_fields
+            if pos > end:
+                break
+            definitions[local_mesg_num] = _compile_definition(
+                global_mesg_num, endian, bytes(field_bytes), dev_data_size, fields)
+        else:
+            definition = definitions.get(local_mesg_num)
+            if definition is None:
+                health['errors'].append(f"Data message with undefined local type {local_mesg_num} at byte {pos}")
+                break
+            size, unpacker, names, missing = definition
+            if pos + 1 + size > end:
+                break
+            if unpacker is not None:
+                for name, value in zip(names, unpacker.unpack_from(data, pos + 1)):
+                    columns[name].append(value)
+                for name in missing:
+                    columns[name].append(None)
+            pos += 1 + size
+    if pos < header_size + data_size and not health['errors']:
+        health['errors'].append(f"Decode stopped at byte {pos} of {header_size + data_size}")
+
+    # Apply invalid markers, scale and offset once per column
+    for name, values in columns.items():
+        _, _, invalid, scale, offset = RECORD_FIELDS[name]
+        if name == 'timestamp':
+            columns[name] = [None if v is None or v == invalid else v + FIT_EPOCH for v in values]
+        elif scale == 1 and offset == 0:
+            columns[name] = [None if v == invalid else v for v in values]
+        else:
+            columns[name] = [None if v is None or v == invalid else v / scale - offset for v in values]
+    return columns
+
+
+def _decode_with_fitparse(fit_file, fields, error_log=None):
+    fitfile = open_fit_file(fit_file, error_log)
+    if fitfile is None:
+        return None
+    return fitfile_record_columns(fitfile, fields)
+
+
+def fitfile_record_columns(fitfile, fields=HOT_FIELDS):
+    """Columns like decode_record_columns() from a file already decoded with open_fit_file()."""
+    columns = {name: [] for name in fields}
+    for record in fitfile.get_messages('record'):
+        values = {}
+        for field in record:
+            if field.name in columns:
+                values[field.name] = field.value
+        for name in fields:
+            value = values.get(name)
+            if name == 'timestamp' and value is not None:
+                value = calendar.timegm(value.utctimetuple())
+            columns[name].append(value)
+    return columns
+
+
+def decode_record_columns(fit_file, fields=HOT_FIELDS, error_log=None):
+    """Decode the given record fields of a FIT file straight into columns.
+
+    Returns {field name: list of values}, one entry per record, with None for
+    missing values. Timestamps are Unix seconds, positions are semicircles and
+    scaled fields are in the FIT profile units (meters, m/s, degrees C).
+    The columns match fitfile_record_columns() on the same file; fields and
+    files the fast path cannot handle are decoded with fitparse instead.
+    """
+    fields = tuple(fields)
+    unknown = [f for f in fields if f not in RECORD_FIELDS]
+    if unknown:
+        return _decode_with_fitparse(fit_file, fields, error_log)
+
+    start = time.perf_counter()
+    health = {'file': os.path.basename(fit_file), 'path': fit_file}
+    try:
+        # Gzipped FIT files are decompressed transparently
+        data = read_bytes(fit_file)
+    except (OSError, EOFError) as e:
+        health.update({'status': 'unreadable', 'messages': 0, 'records': 0, 'errors': [str(e)]})
+        print(f"Warning: {health['file']} is unreadable: {e}")
+        count_file(fit_file, 0, time.perf_counter() - start, health['status'])
+        if error_log is not None:
+            error_log.append(health)
+        return None
+
+    health.update(check_fit_bytes(data))
+    columns = None
+    if health['header_ok']:
+        try:
+            with stage('decode_fast'):
+                columns = _decode(data, health['header_size'], health['data_size'], fields, health)
+        except FastDecodeUnsupported:
+            return _decode_with_fitparse(fit_file, fields, error_log)
+        if health['header_size'] + health['data_size'] + 2 < len(data):
+            # Chained FIT files are left to fitparse
+            return _decode_with_fitparse(fit_file, fields, error_log)
+
+    records = len(columns[fields[0]]) if columns and fields else 0
+    health['records'] = records
+    if columns is None or not records:
+        health['status'] = 'unreadable'
+    elif health['errors']:
+        health['status'] = 'partial'
+    else:
+        health['status'] = 'ok'
+    if health['status'] != 'ok':
+        print(f"Warning: {health['file']} is {health['status']} ({records} records recovered): "
+              + "; ".join(health['errors']))
+    count_file(fit_file, records, time.perf_counter() - start, health['status'])
+    if error_log is not None:
+        error_log.append(health)
+    return columns
+
+
+def fast_latlon_every_n_seconds(fit_file, seconds=15, error_log=None):
+    columns = decode_record_columns(fit_file, ('timestamp', 'position_lat', 'position_long'), error_log)
+    if columns is None:
+        return []
+    lats = []
+    lons = []
+    last_time = None
+    for timestamp, lat, lon in zip(columns['timestamp'], columns['position_lat'], columns['position_long']):
+        if lat is not None and lon is not None and timestamp is not None:
+            if last_time is None or timestamp - last_time >= seconds:
+                lats.append(lat)
+                lons.append(lon)
+                last_time = timestamp
+    return list(zip(degrees_column(lats), degrees_column(lons)))
@@ -1,12 +1,15 @@
+import argparse
 import os
 import re
-from fitparse import FitFile
 
 def extract_day_number(filename):
     match = re.search(r'Day_(\d+)', filename)
     return int(match.group(1)) if match else float('inf')
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concatenate the FIT files in ./test into allRoutes.fit.")
+    parser.parse_known_args(argv)
+
     test_dir = './test'
     out_file = 'allRoutes.fit'
     fit_files = [f for f in os.listdir(test_dir) if f.endswith('.fit')]
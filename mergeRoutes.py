@@ -1,10 +1,8 @@
-from fitparse import FitFile
-
-def semicircles_to_degrees(semicircles):
-    """Convert Garmin FIT semicircles to degrees."""
-    return semicircles * (180.0 / 2**31)
+from units import convert_value, semicircles_to_degrees
 
 def extract_lat_lon(fit_filename):
+    from fitparse import FitFile
+
     fitfile = FitFile(fit_filename)
     coordinates = []
 
@@ -19,11 +17,8 @@ def extract_lat_lon(fit_filename):
             elif field.name == 'position_long':
                 lon = semicircles_to_degrees(field.value)
             elif field.name == 'temperature':
-                # Convert Celsius to Fahrenheit if temperature is not None
-                if field.value is not None:
-                    temperature = field.value * 9.0 / 5.0 + 32.0
-                else:
-                    temperature = None
+                # Convert Celsius to Fahrenheit; a missing temperature stays None
+                temperature = convert_value(field.value, 'temperature', 'imperial')
             elif field.name == 'timestamp':
                 timestamp = field.value
 
@@ -33,6 +28,8 @@ def extract_lat_lon(fit_filename):
     return coordinates
 
 if __name__ == "__main__":
+    from fitparse import FitFile
+
     fit_file_path = "./data/Riding_across_the_US_Day_01_started_Garmin_late.fit"  # Replace with your actual file
 
     coords = extract_lat_lon(fit_file_path)
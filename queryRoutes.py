@@ -1,84 +1,26 @@
-def print_summary_fields(fit_file, summary_json=None):
-    fitfile = FitFile(fit_file)
-    fitfile_name = os.path.basename(fit_file)
+def print_summary_fields(fit_file, summary_json=None, error_log=None, units='imperial'):
+    fitfile = open_fit_file(fit_file, error_log)
+    if fitfile is None:
+        print(f"\nFile: {os.path.basename(fit_file)} could not be decoded, skipping.")
+        return None
     print(f"\nFile: {os.path.basename(fit_file)}")
-    summary = {}
-    # Collect summary fields from activity, session, and file_id messages
-    for msg_type in ['activity', 'session', 'file_id']:
-        for msg in fitfile.get_messages(msg_type):
-            for field in msg:
-                summary[field.name] = field.value
-    # Find ending lat/long from last record
-    end_lat = None
-    end_long = None
-    for record in fitfile.get_messages('record'):
-        lat = None
-        lon = None
-        for field in record:
-            if field.name == 'position_lat':
-                lat = field.value
-            elif field.name == 'position_long':
-                lon = field.value
-        if lat is not None and lon is not None:
-            end_lat = lat
-            end_long = lon
-
-    # Print summary fields
-    if summary:
-        summary_record = {'fitFileName': fitfile_name}
-        for k, v in summary.items():
-            if k in [
-                'max_temperature', 
-                'min_temperature',
-                'avg_temperature',
-                'total_distance',
-                'total_ascent',
-                'total_descent',
-                'total_calories',
-                'total_eplasped_time',
-                'enhanced_elapsed_time',
-                'enhanced_avg_speed',
-                'enhanced_max_speed',
-                'avg_speed',
-                'max_speed',
-                "start_position_lat",
-                "start_position_long",]:
-                if "speed" in k:
-                    v = v * 2.23694
-                elif "temp" in k:
-                    v = v * 1.8 + 32
-                elif "ascent" in k or "descent" in k:
-                    v = v * 3.28084
-                elif "distance" in k:
-                    v = v / 1609.34
-                elif "start_position" in k:
-                    v = v * (180.0 / 2147483648.0)  # Convert to degrees
-
-                if isinstance(v, (float)):
-                    if k in ("start_position_lat", "start_position_long"):
-                        v = f"{v:.6f}"
-                    else:
-                        v = f"{v:.2f}"
-                elif isinstance(v, (int)):
-                    v = f"{v}"
-                print(f"{k}: {v}")
-                summary_record.update({k: v})
-        # Print ending lat/long if found
-        if end_lat is not None and end_long is not None:
-            end_lat_deg = end_lat * (180.0 / 2147483648.0)
-            end_long_deg = end_long * (180.0 / 2147483648.0)
-            print(f"end_position_lat: {end_lat_deg:.6f}")
-            print(f"end_position_long: {end_long_deg:.6f}")
-            summary_record.update({
-                "end_position_lat": f"{end_lat_deg:.6f}",
-                "end_position_long": f"{end_long_deg:.6f}"
-            })
-        if summary_json is not None:
-            summary_json.append(summary_record)
-    else:
+    from summaryRecord import SummaryRecord
+
+    record = SummaryRecord.from_fit(fit_file, fitfile)
+    if record is None:
         print("No summary fields found.")
-def print_all_fields(fit_file):
-    fitfile = FitFile(fit_file)
+        return None
+    # Values are only formatted for display; summary_json keeps the typed record
+    for k, v in record.to_summary_json(units).items():
+        if k != 'fitFileName':
+            print(f"{k}: {v}")
+    if summary_json is not None:
+        summary_json.append(record)
+    return record
+def print_all_fields(fit_file, error_log=None):
+    fitfile = open_fit_file(fit_file, error_log)
+    if fitfile is None:
+        return
     print(f"\nFile: {os.path.basename(fit_file)}")
     # Collect all possible field names
     all_fields = set()
@@ -102,20 +44,42 @@ def print_all_fields(fit_file):
 import os
 import re
 import sys
-import glob
-from fitparse import FitFile
+from safeFitFile import open_fit_file, write_error_log
+from compressedFiles import list_fit_files
+from runReport import stage
+from units import UNIT_SYSTEMS, convert_columns, convert_value, unit_label
+
+USAGE = """usage: queryRoutes.py [--summary | --all_fields | [--total] --<field> ... | --sql <query> [--db <file>]]
+                      [--archive <dir> [--tour <name>] ... [--rider <name>] ... [--workers <n>]]
+                      [--units imperial|metric]
+
+Query the FIT files in ./fitData.
+  (no arguments)  list the record fields available in the first file
+  --summary       write summary.json
+  --all_fields    print every record field of every file
+  --<field> ...   print the named record fields, or their totals with --total
+  --sql <query>   run SQL against the database written by rideDatabase.py
+                  (default rides.db), e.g.
+                  --sql 'SELECT day, total_distance FROM summary ORDER BY day'
+  --archive <dir> query an archive of tours and riders (see rideArchive.py)
+                  instead of ./fitData; --summary writes each selected
+                  rider's summary.json and --<field> reads the shard caches
+  --units <system> imperial or metric; --summary and --total default to
+                  imperial, --<field> prints raw FIT values unless given"""
 
 def extract_day_number(filename):
     match = re.search(r'Day_(\d+)', filename)
     return int(match.group(1)) if match else float('inf')
 
 def get_fit_files(directory):
-    files = glob.glob(os.path.join(directory, '*.fit'))
+    files = list_fit_files(directory)
     files.sort(key=extract_day_number)
     return files
 
-def list_all_fields(fit_file):
-    fitfile = FitFile(fit_file)
+def list_all_fields(fit_file, error_log=None):
+    fitfile = open_fit_file(fit_file, error_log)
+    if fitfile is None:
+        return []
     fields = set()
     for record in fitfile.get_messages('record'):
         for field in record:
@@ -123,8 +87,10 @@ def list_all_fields(fit_file):
     return sorted(fields)
 
 
-def print_total_fields(fit_file, field_names):
-    fitfile = FitFile(fit_file)
+def print_total_fields(fit_file, field_names, error_log=None, units='imperial'):
+    fitfile = open_fit_file(fit_file, error_log)
+    if fitfile is None:
+        return
     print(f"File: {os.path.basename(fit_file)}")
     totals = {field: 0.0 for field in field_names}
     timestamps = []
@@ -148,8 +114,7 @@ def print_total_fields(fit_file, field_names):
                 if field.name == 'distance' and field.value is not None:
                     last_distance = field.value
         if last_distance is not None:
-            # Convert meters to miles
-            totals['distance'] = last_distance * 0.000621371
+            totals['distance'] = convert_value(last_distance, 'distance', units)
     # Special handling for duration and elapsed_time
     if 'duration' in field_names:
         if timestamps:
@@ -168,7 +133,7 @@ def print_total_fields(fit_file, field_names):
     row = []
     for field in field_names:
         if field == 'distance':
-            row.append(f"{field}: {totals[field]:.2f} miles")
+            row.append(f"{field}: {totals[field]:.2f} {unit_label('distance', units)}")
         elif field in ('duration', 'elapsed_time'):
             # Print as H:MM:SS
             seconds = int(totals[field])
@@ -180,29 +145,84 @@ def print_total_fields(fit_file, field_names):
             row.append(f"{field}: {totals[field]}")
     print(", ".join(row))
 
-def print_selected_fields(fit_file, field_names):
-    fitfile = FitFile(fit_file)
+def print_selected_fields(fit_file, field_names, error_log=None, units=None):
+    fitfile = open_fit_file(fit_file, error_log)
+    if fitfile is None:
+        return
     print(f"\nFile: {os.path.basename(fit_file)}")
+    columns = {field_name: [] for field_name in field_names}
     for record in fitfile.get_messages('record'):
-        row = []
+        values = {}
+        for field in record:
+            values.setdefault(field.name, field.value)
         for field_name in field_names:
-            value = None
-            for field in record:
-                if field.name == field_name:
-                    value = field.value
-                    break
-            row.append(str(value) if value is not None else "N/A")
-        print(", ".join(row))
+            columns[field_name].append(values.get(field_name))
+    if units:
+        columns = convert_columns(columns, units)
+    for row in zip(*(columns[field_name] for field_name in field_names)):
+        print(", ".join(str(value) if value is not None else "N/A" for value in row))
+
+
+def option_values(args, option):
+    """Values following each occurrence of --option in a raw argument list."""
+    return [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == option]
+
 
+def query_archive(args, units=None):
+    import rideArchive
 
-def main():
+    root = option_values(args, '--archive')[-1] if option_values(args, '--archive') else './archive'
+    tours = option_values(args, '--tour') or None
+    riders = option_values(args, '--rider') or None
+    workers = int(option_values(args, '--workers')[-1]) if option_values(args, '--workers') else os.cpu_count() or 1
+    skip = {'--archive', '--tour', '--rider', '--workers'}
+    values = set(i + 1 for i, arg in enumerate(args) if arg in skip)
+    options = [arg for i, arg in enumerate(args) if i not in values and arg not in skip]
+    if '--summary' in options:
+        rideArchive.build_archive(root, ['summary'], tours, riders, workers, '--force' in options,
+                                  units or 'imperial')
+        return
+    field_names = [arg[2:] for arg in options if arg.startswith('--') and arg not in ('--total', '--force')]
+    if not field_names:
+        print(f"Fields available in the archive: {', '.join(rideArchive.CACHE_COLUMNS)}")
+        return
+    rideArchive.query_archive(root, field_names, tours, riders, workers, '--total' in options, units)
+
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    if '-h' in args or '--help' in args:
+        print(USAGE)
+        return
+    if '--sql' in args:
+        # Cross-day questions go to the SQLite export instead of re-decoding FIT files
+        from rideDatabase import run_sql
+        sql = args[args.index('--sql') + 1] if args.index('--sql') + 1 < len(args) else ''
+        db_path = args[args.index('--db') + 1] if '--db' in args and args.index('--db') + 1 < len(args) else 'rides.db'
+        if not sql:
+            print("--sql needs a query")
+            return
+        if not os.path.exists(db_path):
+            print(f"Database not found: {db_path} (create it with rideDatabase.py)")
+            return
+        with stage('query'):
+            run_sql(db_path, sql)
+        return
+    units = option_values(args, '--units')[-1] if option_values(args, '--units') else None
+    if units is not None and units not in UNIT_SYSTEMS:
+        print(f"--units must be one of: {', '.join(UNIT_SYSTEMS)}")
+        return
+    if '--units' in args:
+        args = [arg for i, arg in enumerate(args) if arg != '--units' and (i == 0 or args[i - 1] != '--units')]
+    if '--archive' in args:
+        return query_archive(args, units)
     fit_dir = './fitData'
     fit_files = get_fit_files(fit_dir)
-    args = sys.argv[1:]
     total_mode = False
     all_fields_mode = False
     summary_mode = False
     field_names = []
+    error_log = []
     for arg in args:
         if arg == '--total':
             total_mode = True
@@ -214,32 +234,36 @@ def main():
             field_names.append(arg[2:])
     if summary_mode:
         summary_json = []
-        for fit_file in fit_files:
-            print_summary_fields(fit_file, summary_json)
+        with stage('summarize'):
+            for fit_file in fit_files:
+                print_summary_fields(fit_file, summary_json, error_log, units or 'imperial')
         # write summary to a JSON file
         summary_file = os.path.join('./', 'summary.json')
-        with open(summary_file, 'w') as f:
-            import json
-            json.dump(summary_json, f, indent=4)
+        with stage('write'):
+            from summaryRecord import write_summary_json
+            write_summary_json(summary_json, summary_file, units or 'imperial')
         print(f"Summary written to {summary_file}")
     elif all_fields_mode:
-        for fit_file in fit_files:
-            print_all_fields(fit_file)
+        with stage('query'):
+            for fit_file in fit_files:
+                print_all_fields(fit_file, error_log)
     elif not field_names:
         # No fields specified, show all possible fields from the first file
         if not fit_files:
             print("No FIT files found.")
             return
-        fields = list_all_fields(fit_files[0])
+        fields = list_all_fields(fit_files[0], error_log)
         print("Available fields in FIT file:")
         for f in fields:
             print(f)
     else:
-        for fit_file in fit_files:
-            if total_mode:
-                print_total_fields(fit_file, field_names)
-            else:
-                print_selected_fields(fit_file, field_names)
+        with stage('query'):
+            for fit_file in fit_files:
+                if total_mode:
+                    print_total_fields(fit_file, field_names, error_log, units or 'imperial')
+                else:
+                    print_selected_fields(fit_file, field_names, error_log, units)
+    write_error_log(error_log)
 
 if __name__ == "__main__":
     main()
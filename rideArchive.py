@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+rideArchive.py
+
+Build the outputs for a multi-tour, multi-rider archive.
+
+Usage:
+    python rideArchive.py [--archive ./archive] [--tour NAME ...] [--rider NAME ...]
+                          [--outputs summary,start,detail,route] [--workers N] [--force] [--list]
+                          [--units imperial|metric]
+
+Layout:
+    <archive>/archive.json                      manifest: tours -> riders -> shards
+    <archive>/<tour>/<rider>/*.fit[.gz]         one shard per ride file
+    <archive>/<tour>/<rider>/.cache/<file>.pkl  decoded summary and track per shard
+    <archive>/<tour>/<rider>/summary.json, ride_start_locations.kml,
+                             us_ride_detail.kml, us_ride_route.kml
+
+Each tour can set its own "dayPattern" in archive.json: a regex matched
+against the file name whose first group is the day and optional second
+group the part. Shards are decoded in parallel and only when the file
+changed since its cache was written. A rider's outputs are rewritten only
+when its set of shards changed, so adding a tour or rider never touches
+the others.
+"""
+
+import argparse
+import collections
+import json
+import os
+import re
+from array import array
+
+from archiveArguments import add_archive_arguments
+from compressedFiles import is_fit_file
+from runReport import stage, collect_files, record_files
+
+MANIFEST = 'archive.json'
+CACHE_DIR = '.cache'
+CACHE_VERSION = 1
+DAY_PATTERN = r"Day_(\d+)(?:_Part_(\d+))?\.fit(?:\.gz)?$"
+
+# Record columns kept in each shard cache; positions are stored in degrees
+CACHE_COLUMNS = ('timestamp', 'position_lat', 'position_long', 'altitude', 'distance', 'speed', 'temperature')
+
+# output name -> file written in each rider directory
+OUTPUTS = {
+    'summary': 'summary.json',
+    'start': 'ride_start_locations.kml',
+    'detail': 'us_ride_detail.kml',
+    'route': 'us_ride_route.kml',
+}
+
+Shard = collections.namedtuple('Shard', 'tour rider name path key')
+
+
+def order_key(name, pattern=DAY_PATTERN):
+    match = re.search(pattern, name, re.IGNORECASE)
+    if match:
+        day = int(match.group(1))
+        part = int(match.group(2)) if match.lastindex and match.lastindex >= 2 and match.group(2) else 0
+        return (day, part)
+    return (float('inf'), float('inf'))
+
+
+def _subdirs(path):
+    return sorted(d for d in os.listdir(path) if not d.startswith('.') and os.path.isdir(os.path.join(path, d)))
+
+
+def load_manifest(root):
+    path = os.path.join(root, MANIFEST)
+    if not os.path.exists(path):
+        return {'version': 1, 'tours': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(root, manifest):
+    path = os.path.join(root, MANIFEST)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp, path)
+
+
+def scan_archive(root, manifest):
+    """Bring the manifest in line with the tour/rider/shard directories on disk.
+
+    Per-tour settings and the record of built outputs are kept.
+    """
+    tours = {}
+    for tour in _subdirs(root):
+        old_tour = manifest['tours'].get(tour, {})
+        riders = {}
+        for rider in _subdirs(os.path.join(root, tour)):
+            rider_dir = os.path.join(root, tour, rider)
+            shards = {}
+            for name in sorted(os.listdir(rider_dir)):
+                if is_fit_file(name):
+                    st = os.stat(os.path.join(rider_dir, name))
+                    shards[name] = [st.st_mtime, st.st_size]
+            if shards:
+                old_rider = old_tour.get('riders', {}).get(rider, {})
+                riders[rider] = {'shards': shards, 'built': old_rider.get('built', {})}
+        if riders:
+            tours[tour] = {'dayPattern': old_tour.get('dayPattern', DAY_PATTERN), 'riders': riders}
+    manifest['tours'] = tours
+    return manifest
+
+
+def select_shards(root, manifest, tours=None, riders=None):
+    """Return {(tour, rider): [Shard, ...]} in day order for the selected subset."""
+    selected = {}
+    for tour, tour_entry in manifest['tours'].items():
+        if tours and tour not in tours:
+            continue
+        pattern = tour_entry.get('dayPattern', DAY_PATTERN)
+        for rider, rider_entry in tour_entry['riders'].items():
+            if riders and rider not in riders:
+                continue
+            shards = [Shard(tour, rider, name, os.path.join(root, tour, rider, name), order_key(name, pattern))
+                      for name in rider_entry['shards']]
+            shards.sort(key=lambda s: (s.key, s.name))
+            selected[(tour, rider)] = shards
+    return selected
+
+
+def shard_signature(rider_entry, units='imperial'):
+    """Fingerprint of a rider's shard files and units; changes whenever a shard is added, removed or modified."""
+    import hashlib
+
+    return hashlib.sha1(json.dumps([rider_entry['shards'], units], sort_keys=True).encode()).hexdigest()
+
+
+def cache_path(shard_path):
+    directory, name = os.path.split(shard_path)
+    return os.path.join(directory, CACHE_DIR, name + '.pkl')
+
+
+def read_cache(shard_path):
+    """Return the shard's cache if it is current for the file on disk, else None."""
+    import pickle
+
+    st = os.stat(shard_path)
+    try:
+        with open(cache_path(shard_path), 'rb') as f:
+            cache = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if cache.get('version') != CACHE_VERSION or cache.get('stamp') != [st.st_mtime, st.st_size]:
+        return None
+    return cache
+
+
+def decode_shard(shard_path, force=False):
+    """Load one shard from its cache, decoding and caching it first if needed.
+
+    Runs in a worker process. Returns (cache, health reports, per-file
+    decode stats for runReport.record_files).
+    """
+    if not force:
+        cache = read_cache(shard_path)
+        if cache is not None:
+            return cache, [], []
+
+    import pickle
+    from safeFitFile import open_fit_file
+    from fastFitDecoder import fitfile_record_columns
+    from summaryRecord import SummaryRecord
+    from units import degrees_column
+
+    error_log = []
+    st = os.stat(shard_path)
+    with collect_files() as files:
+        fitfile = open_fit_file(shard_path, error_log)
+    # One decode gives both the summary messages and the record columns
+    if fitfile is not None:
+        record = SummaryRecord.from_fit(shard_path, fitfile)
+        columns = fitfile_record_columns(fitfile, CACHE_COLUMNS)
+    else:
+        record, columns = None, {name: [] for name in CACHE_COLUMNS}
+    nan = float('nan')
+    packed = {}
+    for name, values in columns.items():
+        if name in ('position_lat', 'position_long'):
+            values = degrees_column(values)
+        packed[name] = array('d', (nan if v is None else v for v in values))
+    cache = {'version': CACHE_VERSION, 'stamp': [st.st_mtime, st.st_size], 'summary': record, 'columns': packed}
+
+    path = cache_path(shard_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    print(f"Decoded {shard_path}: {len(packed['timestamp'])} records")
+    return cache, error_log, files
+
+
+def load_shards(shards, workers=1, force=False, error_log=None):
+    """Return {shard path: cache}, decoding stale shards across worker processes."""
+    paths = [shard.path for shard in shards]
+    if workers > 1 and len(paths) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with stage('decode'), ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(decode_shard, paths, [force] * len(paths), chunksize=4))
+    else:
+        with stage('decode'):
+            results = [decode_shard(path, force) for path in paths]
+    caches = {}
+    for path, (cache, health, files) in zip(paths, results):
+        caches[path] = cache
+        record_files(files)
+        if error_log is not None:
+            error_log.extend(health)
+    return caches
+
+
+def sample_track(columns, seconds):
+    """Return (lat, lon) points at least `seconds` apart from a shard's cached columns."""
+    points = []
+    last_time = None
+    for timestamp, lat, lon in zip(columns['timestamp'], columns['position_lat'], columns['position_long']):
+        # NaN marks a missing value and never compares equal to itself
+        if lat == lat and lon == lon and timestamp == timestamp:
+            if last_time is None or timestamp - last_time >= seconds:
+                points.append((lat, lon))
+                last_time = timestamp
+    return points
+
+
+def write_track_kml(path, name, tracks, labels):
+    """Write one red route line through all tracks, with a day label at each labelled track's start."""
+    import simplekml
+
+    kml = simplekml.Kml()
+    all_points = []
+    for label, points in zip(labels, tracks):
+        if label is not None and points:
+            lat, lon = points[0]
+            kml.newpoint(name=label, coords=[(lon, lat)])
+        all_points.extend(points)
+    if not all_points:
+        return False
+    ls = kml.newlinestring(name=name, coords=[(lon, lat) for lat, lon in all_points])
+    ls.style.linestyle.width = 4
+    ls.style.linestyle.color = simplekml.Color.red
+    kml.save(path)
+    return True
+
+
+def day_label(key):
+    """Label for a shard's day, or None unless it is the day's first file."""
+    day, part = key
+    if day == float('inf') or part not in (0, 1):
+        return None
+    return f"{day:02d}"
+
+
+def write_outputs(rider_dir, shards, caches, outputs, units='imperial'):
+    """Write the requested outputs for one rider from its shard caches."""
+    from summaryRecord import write_summary_json
+    from drawDayRoute import write_start_kml
+
+    with_summary = [s for s in shards if caches[s.path]['summary'] is not None]
+    records = [caches[s.path]['summary'] for s in with_summary]
+    with stage('write'):
+        if 'summary' in outputs:
+            write_summary_json(records, os.path.join(rider_dir, OUTPUTS['summary']), units)
+        if 'start' in outputs:
+            write_start_kml(records, os.path.join(rider_dir, OUTPUTS['start']),
+                            [day_label(s.key) for s in with_summary])
+        if 'detail' in outputs:
+            tracks = [sample_track(caches[s.path]['columns'], 30) for s in shards]
+            write_track_kml(os.path.join(rider_dir, OUTPUTS['detail']), "US Ride Detail", tracks,
+                            [day_label(s.key) for s in shards])
+        if 'route' in outputs:
+            tracks = [sample_track(caches[s.path]['columns'], 10 * 60) for s in shards]
+            write_track_kml(os.path.join(rider_dir, OUTPUTS['route']), "US Ride Detail", tracks,
+                            [None] * len(tracks))
+
+
+def build_archive(root, outputs, tours=None, riders=None, workers=1, force=False, units='imperial'):
+    """Scan the archive and rebuild the outputs of every selected rider whose shards changed.
+
+    Returns the list of (tour, rider) pairs that were rebuilt.
+    """
+    from safeFitFile import write_error_log
+
+    with stage('scan'):
+        manifest = scan_archive(root, load_manifest(root))
+        selected = select_shards(root, manifest, tours, riders)
+
+    stale = {}
+    for (tour, rider), shards in selected.items():
+        entry = manifest['tours'][tour]['riders'][rider]
+        signature = shard_signature(entry, units)
+        rider_dir = os.path.join(root, tour, rider)
+        todo = [o for o in outputs
+                if force or entry['built'].get(o) != signature
+                or not os.path.exists(os.path.join(rider_dir, OUTPUTS[o]))]
+        if todo:
+            stale[(tour, rider)] = todo
+
+    # Decode every stale rider's shards in one pool so small riders still run in parallel
+    error_log = []
+    caches = load_shards([s for key in stale for s in selected[key]], workers, force, error_log)
+    for (tour, rider), todo in stale.items():
+        entry = manifest['tours'][tour]['riders'][rider]
+        write_outputs(os.path.join(root, tour, rider), selected[(tour, rider)], caches, todo, units)
+        for output in todo:
+            entry['built'][output] = shard_signature(entry, units)
+        print(f"Built {tour}/{rider}: {', '.join(OUTPUTS[o] for o in todo)}")
+    save_manifest(root, manifest)
+    write_error_log(error_log, os.path.join(root, 'fit_errors.json'))
+    return list(stale)
+
+
+def run_from_args(args, outputs):
+    """Entry point for scripts given --archive: build only their outputs."""
+    rebuilt = build_archive(args.archive, outputs, args.tour, args.rider, args.workers, args.force,
+                            getattr(args, 'units', 'imperial'))
+    if not rebuilt:
+        print("All selected outputs are up to date")
+
+
+def query_archive(root, field_names, tours=None, riders=None, workers=1, total=False, units=None):
+    """Print the named record fields (or their totals) for every selected shard from its cache."""
+    unknown = [f for f in field_names if f not in CACHE_COLUMNS]
+    if unknown:
+        print(f"Fields not kept in the archive cache: {', '.join(unknown)} "
+              f"(available: {', '.join(CACHE_COLUMNS)})")
+        return
+    from units import convert_columns, convert_value, unit_label
+
+    manifest = scan_archive(root, load_manifest(root))
+    save_manifest(root, manifest)
+    selected = select_shards(root, manifest, tours, riders)
+    shards = [s for key in selected for s in selected[key]]
+    caches = load_shards(shards, workers)
+    with stage('query'):
+        for shard in shards:
+            columns = {field: [None if v != v else v for v in caches[shard.path]['columns'][field]]
+                       for field in field_names}
+            if units and not total:
+                columns = convert_columns(columns, units)
+            print(f"\nFile: {shard.tour}/{shard.rider}/{shard.name}")
+            if total:
+                row = []
+                for field in field_names:
+                    values = [v for v in columns[field] if v is not None]
+                    if field == 'distance':
+                        # Distance is cumulative; the last record is the total
+                        distance = convert_value(values[-1], field, units or 'imperial') if values else 0.0
+                        row.append(f"{field}: {distance:.2f} {unit_label(field, units or 'imperial')}")
+                    else:
+                        row.append(f"{field}: {sum(values)}")
+                print(", ".join(row))
+            else:
+                for row in zip(*(columns[field] for field in field_names)):
+                    print(", ".join("N/A" if v is None else str(v) for v in row))
+
+
+def print_manifest(root, manifest, tours=None, riders=None):
+    for (tour, rider), shards in select_shards(root, manifest, tours, riders).items():
+        built = manifest['tours'][tour]['riders'][rider]['built']
+        print(f"{tour}/{rider}: {len(shards)} shard(s); built: {', '.join(sorted(built)) or 'nothing'}")
+
+
+def main(argv=None):
+    from units import add_units_argument
+
+    parser = argparse.ArgumentParser(description="Build the outputs for a multi-tour, multi-rider archive.")
+    add_archive_arguments(parser)
+    add_units_argument(parser)
+    parser.add_argument("--outputs", default=','.join(OUTPUTS),
+                        help=f"Comma separated outputs to build (default: {','.join(OUTPUTS)})")
+    parser.add_argument("--list", action="store_true",
+                        help="Update archive.json and list the selected tours and riders")
+    args, _ = parser.parse_known_args(argv)
+    args.archive = args.archive or './archive'
+
+    if args.list:
+        manifest = scan_archive(args.archive, load_manifest(args.archive))
+        save_manifest(args.archive, manifest)
+        print_manifest(args.archive, manifest, args.tour, args.rider)
+        return
+    outputs = [o for o in args.outputs.split(',') if o]
+    unknown = [o for o in outputs if o not in OUTPUTS]
+    if unknown:
+        parser.error(f"unknown outputs: {', '.join(unknown)}")
+    run_from_args(args, outputs)
+
+
+if __name__ == "__main__":
+    main()
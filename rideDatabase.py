@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+rideDatabase.py
+
+Export the decoded FIT files to a local SQLite database.
+
+Usage:
+    python rideDatabase.py [--db rides.db] [--fitDir ./fitData] [--force]
+
+Tables (SI units: meters, m/s, degrees C, seconds; positions in degrees;
+times in Unix seconds):
+    files    one row per exported FIT file, with its size/mtime so unchanged
+             files are skipped on the next export; unreadable files are
+             listed with status 'unreadable' and no summary or records
+    summary  one row per file from its session message
+    records  one row per record message
+Query them with `queryRoutes.py --sql "SELECT ..."`.
+"""
+
+import argparse
+import itertools
+import os
+import re
+import sqlite3
+
+from runReport import stage
+from units import degrees_column, semicircles_to_degrees
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file TEXT PRIMARY KEY,
+    day INTEGER,
+    part INTEGER,
+    size INTEGER,
+    mtime REAL,
+    status TEXT,
+    records INTEGER
+);
+CREATE TABLE IF NOT EXISTS summary (
+    file TEXT PRIMARY KEY REFERENCES files(file),
+    day INTEGER,
+    part INTEGER,
+    start_time INTEGER,
+    end_time INTEGER,
+    total_elapsed_time REAL,
+    total_timer_time REAL,
+    total_distance REAL,
+    total_ascent REAL,
+    total_descent REAL,
+    total_calories INTEGER,
+    avg_speed REAL,
+    max_speed REAL,
+    avg_temperature REAL,
+    max_temperature REAL,
+    min_temperature REAL,
+    start_lat REAL,
+    start_lon REAL,
+    end_lat REAL,
+    end_lon REAL
+);
+CREATE TABLE IF NOT EXISTS records (
+    file TEXT REFERENCES files(file),
+    day INTEGER,
+    timestamp INTEGER,
+    lat REAL,
+    lon REAL,
+    altitude REAL,
+    distance REAL,
+    speed REAL,
+    temperature REAL
+);
+CREATE INDEX IF NOT EXISTS summary_day ON summary(day);
+CREATE INDEX IF NOT EXISTS records_file ON records(file);
+CREATE INDEX IF NOT EXISTS records_day_time ON records(day, timestamp);
+CREATE INDEX IF NOT EXISTS records_time ON records(timestamp);
+CREATE INDEX IF NOT EXISTS records_position ON records(lat, lon);
+"""
+
+SUMMARY_COLUMNS = (
+    'file', 'day', 'part', 'start_time', 'end_time', 'total_elapsed_time', 'total_timer_time',
+    'total_distance', 'total_ascent', 'total_descent', 'total_calories', 'avg_speed', 'max_speed',
+    'avg_temperature', 'max_temperature', 'min_temperature', 'start_lat', 'start_lon', 'end_lat', 'end_lon',
+)
+
+RECORD_FIELDS = ('timestamp', 'position_lat', 'position_long', 'altitude', 'distance', 'speed', 'temperature')
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def day_and_part(filename):
+    match = re.search(r'Day_(\d+)(?:_Part_(\d+))?', os.path.basename(filename), re.IGNORECASE)
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2)) if match.group(2) else 0
+
+
+def summary_row(fit_file, fitfile, columns):
+    """Build a summary row from the summary record and the decoded records."""
+    from summaryRecord import SummaryRecord
+
+    record = SummaryRecord.from_fit(fit_file, fitfile) or SummaryRecord(os.path.basename(fit_file))
+    end_lat = end_lon = None
+    for lat, lon in zip(reversed(columns['position_lat']), reversed(columns['position_long'])):
+        if lat is not None and lon is not None:
+            end_lat, end_lon = semicircles_to_degrees(lat), semicircles_to_degrees(lon)
+            break
+    day, part = day_and_part(fit_file)
+    values = {
+        'file': record.fit_file_name,
+        'day': day,
+        'part': part,
+        'start_time': record.start_time,
+        'end_time': record.end_time,
+        'total_elapsed_time': record.total_elapsed_time,
+        'total_timer_time': record.total_timer_time,
+        'total_distance': record.total_distance,
+        'total_ascent': record.total_ascent,
+        'total_descent': record.total_descent,
+        'total_calories': record.total_calories,
+        'avg_speed': record.enhanced_avg_speed if record.enhanced_avg_speed is not None else record.avg_speed,
+        'max_speed': record.enhanced_max_speed if record.enhanced_max_speed is not None else record.max_speed,
+        'avg_temperature': record.avg_temperature,
+        'max_temperature': record.max_temperature,
+        'min_temperature': record.min_temperature,
+        'start_lat': record.start_position_lat,
+        'start_lon': record.start_position_long,
+        'end_lat': end_lat,
+        'end_lon': end_lon,
+    }
+    return tuple(values[c] for c in SUMMARY_COLUMNS)
+
+
+def record_rows(fit_file, columns):
+    name = os.path.basename(fit_file)
+    day, _ = day_and_part(fit_file)
+    return zip(itertools.repeat(name), itertools.repeat(day), columns['timestamp'],
+               degrees_column(columns['position_lat']), degrees_column(columns['position_long']),
+               columns['altitude'], columns['distance'], columns['speed'], columns['temperature'])
+
+
+def export_fit_file(conn, fit_file, error_log=None):
+    """Replace one file's summary and records in a single transaction.
+
+    Returns the number of records, or None if nothing could be decoded. An
+    unreadable file is still listed in files, so it is skipped until it changes.
+    """
+    from safeFitFile import open_fit_file
+    from fastFitDecoder import fitfile_record_columns
+
+    fitfile = open_fit_file(fit_file, error_log)
+    name = os.path.basename(fit_file)
+    day, part = day_and_part(fit_file)
+    st = os.stat(fit_file)
+    if fitfile is None:
+        with stage('db_write'), conn:
+            conn.execute('DELETE FROM records WHERE file = ?', (name,))
+            conn.execute('DELETE FROM summary WHERE file = ?', (name,))
+            conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (name, day, part, st.st_size, st.st_mtime, 'unreadable', 0))
+        return None
+    # The summary needs the full decode anyway, so the record columns come from it too
+    columns = fitfile_record_columns(fitfile, RECORD_FIELDS)
+    with stage('db_write'), conn:
+        conn.execute('DELETE FROM records WHERE file = ?', (name,))
+        conn.execute('DELETE FROM summary WHERE file = ?', (name,))
+        conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (name, day, part, st.st_size, st.st_mtime, fitfile.health['status'],
+                      len(columns['timestamp'])))
+        conn.execute(f'INSERT INTO summary VALUES ({", ".join("?" * len(SUMMARY_COLUMNS))})',
+                     summary_row(fit_file, fitfile, columns))
+        conn.executemany('INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         record_rows(fit_file, columns))
+    return len(columns['timestamp'])
+
+
+def is_current(conn, fit_file):
+    st = os.stat(fit_file)
+    row = conn.execute('SELECT size, mtime FROM files WHERE file = ?', (os.path.basename(fit_file),)).fetchone()
+    return row is not None and row[0] == st.st_size and row[1] == st.st_mtime
+
+
+def export_fit_files(conn, fit_files, force=False, error_log=None):
+    exported = 0
+    for fit_file in fit_files:
+        if not force and is_current(conn, fit_file):
+            continue
+        records = export_fit_file(conn, fit_file, error_log)
+        if records is None:
+            print(f"Skipped {os.path.basename(fit_file)}: unreadable")
+            continue
+        print(f"Exported {os.path.basename(fit_file)}: {records} records")
+        exported += 1
+    return exported
+
+
+def load_summary_records(db_path):
+    """Read the summary table back as SummaryRecords, ordered by day and part."""
+    from summaryRecord import SummaryRecord
+
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(f'SELECT {", ".join(SUMMARY_COLUMNS)} FROM summary ORDER BY day, part').fetchall()
+    finally:
+        conn.close()
+    records = []
+    for row in rows:
+        values = dict(zip(SUMMARY_COLUMNS, row))
+        record = SummaryRecord(values['file'])
+        for name in ('start_time', 'end_time', 'total_elapsed_time', 'total_timer_time', 'total_distance',
+                     'total_ascent', 'total_descent', 'total_calories', 'avg_speed', 'max_speed',
+                     'avg_temperature', 'max_temperature', 'min_temperature'):
+            setattr(record, name, values[name])
+        record.start_position_lat, record.start_position_long = values['start_lat'], values['start_lon']
+        record.end_position_lat, record.end_position_long = values['end_lat'], values['end_lon']
+        records.append(record)
+    return records
+
+
+def run_sql(db_path, sql):
+    """Run one SQL statement and print the header and rows comma separated."""
+    conn = connect(db_path)
+    try:
+        cursor = conn.execute(sql)
+        if cursor.description:
+            print(", ".join(d[0] for d in cursor.description))
+            for row in cursor:
+                print(", ".join("N/A" if v is None else str(v) for v in row))
+    except sqlite3.Error as e:
+        print(f"SQL error: {e}")
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the FIT files to a SQLite database.")
+    parser.add_argument("--db", default="rides.db",
+                        help="SQLite database file (default: rides.db)")
+    parser.add_argument("--fitDir", default="./fitData",
+                        help="Directory of FIT files (default: ./fitData)")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-export files even if they have not changed")
+    args, _ = parser.parse_known_args(argv)
+
+    from buildSummaryFile import get_fit_files
+    from safeFitFile import write_error_log
+
+    error_log = []
+    conn = connect(args.db)
+    try:
+        exported = export_fit_files(conn, get_fit_files(args.fitDir), args.force, error_log)
+    finally:
+        conn.close()
+    print(f"{exported} file(s) exported to {args.db}")
+    write_error_log(error_log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+rideHeatmap.py
+
+Draw a visit-density heatmap of every recorded point as a KML GroundOverlay.
+
+Usage:
+    python rideHeatmap.py [--fitDir ./fitData] [--zoom Z] [--maxSize 2048] [--halfLife DAYS]
+                          [--output ride_heatmap.kml] [--workers N]
+    python rideHeatmap.py --archive ./archive [--tour NAME ...] [--rider NAME ...]
+
+Points are binned into Web Mercator pixels at map zoom level Z (256 << Z
+pixels around the world). Rides are binned one at a time in worker
+processes and merged into a sparse {pixel: weight} map, so memory grows
+with the area covered rather than with the number of points. Without
+--zoom the binning starts at zoom 17 and coarsens one level whenever the
+covered area grows past --maxSize pixels. With --halfLife a ride's points
+count half as much for every DAYS it is older than the newest ride.
+
+The heatmap is written as an 8-bit palette PNG next to the KML.
+"""
+
+import argparse
+import math
+import os
+import struct
+import zlib
+from collections import Counter
+
+from runReport import stage, record_files
+
+MAX_ZOOM = 17
+MAX_LATITUDE = 85.0511287798
+
+
+def pixel_keys(lats, lons, zoom):
+    """Web Mercator pixel of each point at the given zoom, packed as (y << 32) | x."""
+    size = 256 << zoom
+    radians, log, tan, pi = math.radians, math.log, math.tan, math.pi
+    keys = []
+    for lat, lon in zip(lats, lons):
+        # None and NaN mark a missing value
+        if lat is None or lon is None or lat != lat or lon != lon:
+            continue
+        lat = min(max(lat, -MAX_LATITUDE), MAX_LATITUDE)
+        x = int((lon + 180.0) / 360.0 * size)
+        y = int((1.0 - log(tan(pi / 4 + radians(lat) / 2)) / pi) / 2.0 * size)
+        keys.append((min(max(y, 0), size - 1) << 32) | min(max(x, 0), size - 1))
+    return keys
+
+
+def coarsen(counts, levels):
+    """Merge a {pixel: weight} map into pixels `levels` zoom levels coarser."""
+    if not levels:
+        return counts
+    merged = Counter() if isinstance(counts, Counter) else {}
+    mask = 0xFFFFFFFF
+    for key, weight in counts.items():
+        coarse = ((key >> 32 >> levels) << 32) | ((key & mask) >> levels)
+        merged[coarse] = merged.get(coarse, 0) + weight
+    return merged
+
+
+def extent(keys):
+    """(min x, min y, max x, max y) of packed pixel keys."""
+    mask = 0xFFFFFFFF
+    xs = [key & mask for key in keys]
+    ys = [key >> 32 for key in keys]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def bin_ride(path, zoom, archive=False):
+    """Bin one ride's points. Runs in a worker process.
+
+    Returns (first timestamp or None, Counter of pixel hits, health reports,
+    per-file decode stats for runReport.record_files).
+    """
+    from runReport import collect_files
+
+    error_log = []
+    if archive:
+        from rideArchive import decode_shard
+
+        cache, error_log, files = decode_shard(path)
+        columns = cache['columns']
+        lats, lons = columns['position_lat'], columns['position_long']
+    else:
+        from fastFitDecoder import decode_record_columns
+        from units import degrees_column
+
+        with collect_files() as files:
+            columns = decode_record_columns(path, ('timestamp', 'position_lat', 'position_long'), error_log)
+        if columns is None:
+            return None, Counter(), error_log, files
+        lats, lons = degrees_column(columns['position_lat']), degrees_column(columns['position_long'])
+    started = next((t for t in columns['timestamp'] if t is not None and t == t), None)
+    return started, Counter(pixel_keys(lats, lons, zoom)), error_log, files
+
+
+class Heatmap(object):
+    """Sparse Web Mercator raster of weighted point counts."""
+
+    def __init__(self, zoom=None, max_size=2048):
+        self.fixed = zoom is not None
+        self.zoom = MAX_ZOOM if zoom is None else zoom
+        self.max_size = max_size
+        self.weights = {}
+        self.bounds = None
+
+    def add(self, counts, zoom, weight=1.0):
+        """Add a ride's pixel counts, binned at `zoom`, with the given weight."""
+        if not counts:
+            return
+        counts = coarsen(counts, zoom - self.zoom)
+        x0, y0, x1, y1 = extent(counts)
+        if self.bounds is not None:
+            bx0, by0, bx1, by1 = self.bounds
+            x0, y0, x1, y1 = min(x0, bx0), min(y0, by0), max(x1, bx1), max(y1, by1)
+        weights = self.weights
+        for key, count in counts.items():
+            weights[key] = weights.get(key, 0.0) + count * weight
+        self.bounds = (x0, y0, x1, y1)
+        if not self.fixed:
+            while max(x1 - x0, y1 - y0) + 1 > self.max_size and self.zoom > 0:
+                self.weights = coarsen(self.weights, 1)
+                self.zoom -= 1
+                x0, y0, x1, y1 = x0 >> 1, y0 >> 1, x1 >> 1, y1 >> 1
+            self.bounds = (x0, y0, x1, y1)
+
+    def lat_lon_box(self):
+        """(north, south, east, west) in degrees of the covered pixels."""
+        x0, y0, x1, y1 = self.bounds
+        size = 256 << self.zoom
+
+        def lat(y):
+            return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / size))))
+
+        return lat(y0), lat(y1 + 1), (x1 + 1) / size * 360.0 - 180.0, x0 / size * 360.0 - 180.0
+
+    def rows(self):
+        """Yield one bytes row of palette indices per output row, north to south.
+
+        A GroundOverlay stretches the image linearly in latitude, so each
+        output row takes the heaviest of the Mercator rows it spans.
+        """
+        x0, y0, x1, y1 = self.bounds
+        width, height = x1 - x0 + 1, y1 - y0 + 1
+        size = 256 << self.zoom
+        # Log scale so a road ridden once still shows next to one ridden daily
+        top = math.log1p(max(self.weights.values()))
+        by_row = {}
+        mask = 0xFFFFFFFF
+        for key, weight in self.weights.items():
+            level = 1 + int(254 * math.log1p(weight) / top) if top else 255
+            by_row.setdefault((key >> 32) - y0, []).append(((key & mask) - x0, level))
+        north, south, _, _ = self.lat_lon_box()
+
+        def mercator_row(lat):
+            return (1.0 - math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) / math.pi) / 2.0 * size - y0
+
+        step = (north - south) / height
+        for r in range(height):
+            first = min(int(mercator_row(north - r * step)), height - 1)
+            last = min(max(first + 1, math.ceil(mercator_row(north - (r + 1) * step))), height)
+            row = bytearray(width)
+            for y in range(first, last):
+                for x, level in by_row.get(y, ()):
+                    if level > row[x]:
+                        row[x] = level
+            yield bytes(row)
+
+    def size(self):
+        x0, y0, x1, y1 = self.bounds
+        return x1 - x0 + 1, y1 - y0 + 1
+
+
+def palette():
+    """256-entry RGB palette and alpha table: 0 is transparent, then dark red to yellow to white."""
+    rgb = bytearray(b'\0\0\0')
+    alpha = bytearray(b'\0')
+    for i in range(1, 256):
+        s = i / 255.0
+        rgb += bytes((min(255, int(3 * s * 255)), max(0, min(255, int((3 * s - 1) * 255))),
+                      max(0, min(255, int((3 * s - 2) * 255)))))
+        alpha.append(96 + int(159 * s))
+    return bytes(rgb), bytes(alpha)
+
+
+def png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def write_png(path, width, height, rows):
+    """Write an 8-bit palette PNG, compressing the rows as they are produced."""
+    rgb, alpha = palette()
+    compressor = zlib.compressobj(9)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)))
+        f.write(png_chunk(b'PLTE', rgb))
+        f.write(png_chunk(b'tRNS', alpha))
+        for row in rows:
+            # Filter type 0 (none) before each row
+            data = compressor.compress(b'\0' + row)
+            if data:
+                f.write(png_chunk(b'IDAT', data))
+        f.write(png_chunk(b'IDAT', compressor.flush()))
+        f.write(png_chunk(b'IEND', b''))
+
+
+def write_heatmap_kml(heatmap, kml_path, name="Ride Heatmap"):
+    import simplekml
+
+    png_path = os.path.splitext(kml_path)[0] + '.png'
+    width, height = heatmap.size()
+    with stage('render'):
+        write_png(png_path, width, height, heatmap.rows())
+    north, south, east, west = heatmap.lat_lon_box()
+    kml = simplekml.Kml()
+    overlay = kml.newgroundoverlay(name=name)
+    # Relative to the KML so the pair can be moved together
+    overlay.icon.href = os.path.basename(png_path)
+    overlay.latlonbox.north = north
+    overlay.latlonbox.south = south
+    overlay.latlonbox.east = east
+    overlay.latlonbox.west = west
+    kml.save(kml_path)
+    return png_path
+
+
+def ride_paths(args):
+    """Return (paths, archive) for the rides selected on the command line."""
+    if args.archive:
+        from rideArchive import load_manifest, save_manifest, scan_archive, select_shards
+
+        manifest = scan_archive(args.archive, load_manifest(args.archive))
+        save_manifest(args.archive, manifest)
+        selected = select_shards(args.archive, manifest, args.tour, args.rider)
+        return [shard.path for shards in selected.values() for shard in shards], True
+    from buildSummaryFile import get_fit_files
+
+    return get_fit_files(args.fitDir), False
+
+
+def main(argv=None):
+    from archiveArguments import add_archive_arguments
+
+    parser = argparse.ArgumentParser(description="Draw a visit-density heatmap of every ride as a KML overlay.")
+    parser.add_argument("--fitDir", default="./fitData",
+                        help="Directory of FIT files (default: ./fitData)")
+    parser.add_argument("--zoom", type=int, choices=range(0, 24), metavar="Z",
+                        help=f"Map zoom level of the pixels (default: the finest up to {MAX_ZOOM} "
+                             "that fits --maxSize)")
+    parser.add_argument("--maxSize", type=int, default=2048,
+                        help="Largest width or height of the image in pixels (default: 2048)")
+    parser.add_argument("--halfLife", type=float, metavar="DAYS",
+                        help="Halve a ride's weight for every DAYS it is older than the newest ride")
+    parser.add_argument("--output", default="ride_heatmap.kml",
+                        help="KML file; the PNG is written next to it (default: ride_heatmap.kml)")
+    add_archive_arguments(parser)
+    args, _ = parser.parse_known_args(argv)
+
+    from safeFitFile import write_error_log
+
+    paths, archive = ride_paths(args)
+    if not paths:
+        print("No FIT files found.")
+        return
+    heatmap = Heatmap(args.zoom, args.maxSize)
+    zoom = heatmap.zoom
+    error_log = []
+    reference = None
+
+    def merge(path, started, counts, health, files):
+        nonlocal reference
+        error_log.extend(health)
+        record_files(files)
+        weight = 1.0
+        if args.halfLife and started is not None:
+            # Weights are relative to the first ride binned; the image is scaled
+            # to its heaviest pixel, so only the ratios between rides matter
+            if reference is None:
+                reference = started
+            exponent = (started - reference) / (args.halfLife * 86400.0)
+            if exponent > 512:
+                # Keep the weights in float range by moving the reference forward
+                heatmap.weights = {k: w * 0.5 ** exponent for k, w in heatmap.weights.items()}
+                reference, exponent = started, 0.0
+            weight = 2.0 ** exponent
+        heatmap.add(counts, zoom, weight)
+        print(f"Binned {path}: {sum(counts.values())} points")
+
+    # Each ride is merged as soon as it is binned, so only the map and the rides in flight are held
+    with stage('bin'):
+        if args.workers > 1 and len(paths) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                results = pool.map(bin_ride, paths, [zoom] * len(paths), [archive] * len(paths))
+                for path, result in zip(paths, results):
+                    merge(path, *result)
+        else:
+            for path in paths:
+                merge(path, *bin_ride(path, zoom, archive))
+    if heatmap.bounds is None:
+        print("No points found.")
+    else:
+        width, height = heatmap.size()
+        if max(width, height) > args.maxSize:
+            print(f"Heatmap would be {width}x{height} pixels at zoom {heatmap.zoom}; "
+                  f"lower --zoom or raise --maxSize")
+        else:
+            png_path = write_heatmap_kml(heatmap, args.output)
+            print(f"Heatmap written to {args.output} and {png_path} "
+                  f"({width}x{height} pixels at zoom {heatmap.zoom})")
+    write_error_log(error_log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+rideServer.py
+
+Serve the decoded ride archive over local HTTP/JSON.
+
+Usage:
+    python rideServer.py [--port 8765] [--host 127.0.0.1]
+
+Every FIT file in ./fitData is decoded once at startup. Endpoints:
+    /summary                         summary records in SI units (m, m/s, degrees C, s)
+    /days                            day files with record counts and bounds
+    /days/<file>/track               one day's track
+    /query                           records across all days
+Query parameters for /track and /query:
+    fields=timestamp,lat,lon,...     columns to return (default timestamp,lat,lon)
+    every=<seconds>                  keep at most one point per interval
+    start=<unix s>&end=<unix s>      time window
+    bbox=<minLon>,<minLat>,<maxLon>,<maxLat>
+    day=<file>[,<file>...]           (/query only) restrict to these days
+    units=metric|imperial            convert speeds, distances, altitudes and
+                                     temperatures (default: SI units)
+Rendered responses are kept in an LRU cache.
+"""
+
+import argparse
+import bisect
+import json
+import os
+from functools import lru_cache
+from urllib.parse import parse_qs, unquote, urlparse
+
+from runReport import stage
+from units import UNIT_SYSTEMS, convert_columns, degrees_column
+
+COLUMNS = ('timestamp', 'position_lat', 'position_long', 'altitude', 'distance', 'speed', 'temperature')
+# Short names accepted in ?fields= for the position columns
+ALIASES = {'lat': 'position_lat', 'lon': 'position_long'}
+DEFAULT_FIELDS = ('timestamp', 'position_lat', 'position_long')
+
+
+class RideArchive(object):
+    """All days decoded into memory: per-day columns with positions in degrees."""
+
+    def __init__(self, fit_dir, error_log=None):
+        from buildSummaryFile import get_fit_files
+        from fastFitDecoder import fitfile_record_columns
+        from safeFitFile import open_fit_file
+        from summaryRecord import SummaryRecord
+
+        self.days = {}
+        self.summary = []
+        for fit_file in get_fit_files(fit_dir):
+            name = os.path.basename(fit_file)
+            fitfile = open_fit_file(fit_file, error_log)
+            if fitfile is None:
+                continue
+            # One decode gives both the summary messages and the record columns
+            record = SummaryRecord.from_fit(fit_file, fitfile)
+            if record is not None:
+                self.summary.append(record)
+            columns = fitfile_record_columns(fitfile, COLUMNS)
+            # Keep only records with a timestamp, in time order, so windows can bisect
+            keep = sorted((i for i, t in enumerate(columns['timestamp']) if t is not None),
+                          key=lambda i: columns['timestamp'][i])
+            day = {col: [values[i] for i in keep] for col, values in columns.items()}
+            day['position_lat'] = degrees_column(day['position_lat'])
+            day['position_long'] = degrees_column(day['position_long'])
+            lats = [v for v in day['position_lat'] if v is not None]
+            lons = [v for v in day['position_long'] if v is not None]
+            day['bbox'] = (min(lons), min(lats), max(lons), max(lats)) if lats else None
+            self.days[name] = day
+        print(f"Loaded {len(self.days)} days, {sum(len(d['timestamp']) for d in self.days.values())} records")
+
+    def day_info(self):
+        return [{
+            'file': name,
+            'records': len(day['timestamp']),
+            'start': day['timestamp'][0] if day['timestamp'] else None,
+            'end': day['timestamp'][-1] if day['timestamp'] else None,
+            'bbox': day['bbox'],
+        } for name, day in self.days.items()]
+
+    def select(self, name, fields, every=None, start=None, end=None, bbox=None):
+        """Return {field: values} for one day after windowing, bbox filtering and downsampling."""
+        day = self.days[name]
+        timestamps = day['timestamp']
+        lo = bisect.bisect_left(timestamps, start) if start is not None else 0
+        hi = bisect.bisect_right(timestamps, end) if end is not None else len(timestamps)
+        if bbox is not None and (day['bbox'] is None or not _overlaps(day['bbox'], bbox)):
+            lo = hi
+        lats, lons = day['position_lat'], day['position_long']
+        rows = []
+        last_time = None
+        for i in range(lo, hi):
+            if bbox is not None:
+                lat, lon = lats[i], lons[i]
+                if lat is None or not (bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3]):
+                    continue
+            if every:
+                if last_time is not None and timestamps[i] - last_time < every:
+                    continue
+                last_time = timestamps[i]
+            rows.append(i)
+        return {field: [day[field][i] for i in rows] for field in fields}
+
+
+def _overlaps(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class QueryError(ValueError):
+    pass
+
+
+def parse_params(query):
+    params = {k: v[-1] for k, v in parse_qs(query).items()}
+    fields = tuple(ALIASES.get(f, f) for f in params.get('fields', ','.join(DEFAULT_FIELDS)).split(',') if f)
+    unknown = [f for f in fields if f not in COLUMNS]
+    if unknown:
+        raise QueryError(f"Unknown fields: {', '.join(unknown)}")
+    try:
+        every = float(params['every']) if 'every' in params else None
+        start = float(params['start']) if 'start' in params else None
+        end = float(params['end']) if 'end' in params else None
+        bbox = tuple(float(v) for v in params['bbox'].split(',')) if 'bbox' in params else None
+    except ValueError as e:
+        raise QueryError(f"Bad parameter: {e}")
+    if bbox is not None and len(bbox) != 4:
+        raise QueryError("bbox needs minLon,minLat,maxLon,maxLat")
+    days = tuple(params['day'].split(',')) if 'day' in params else None
+    units = params.get('units')
+    if units is not None and units not in UNIT_SYSTEMS:
+        raise QueryError(f"units must be one of: {', '.join(UNIT_SYSTEMS)}")
+    return fields, every, start, end, bbox, days, units
+
+
+def make_handler(archive, cache_size):
+    from dataclasses import asdict
+    from http.server import BaseHTTPRequestHandler
+
+    @lru_cache(maxsize=cache_size)
+    def render(path, query):
+        """Return (status, body bytes) for one request; cached per path and query."""
+        parts = [unquote(p) for p in path.strip('/').split('/') if p]
+        try:
+            if parts == ['summary']:
+                result = [asdict(record) for record in archive.summary]
+            elif parts == ['days']:
+                result = archive.day_info()
+            elif len(parts) == 3 and parts[0] == 'days' and parts[2] == 'track':
+                if parts[1] not in archive.days:
+                    return 404, json.dumps({'error': f"No such day: {parts[1]}"}).encode()
+                fields, every, start, end, bbox, _, units = parse_params(query)
+                result = archive.select(parts[1], fields, every, start, end, bbox)
+                if units:
+                    result = convert_columns(result, units)
+            elif parts == ['query']:
+                fields, every, start, end, bbox, days, units = parse_params(query)
+                result = {}
+                for name in (days or archive.days):
+                    if name in archive.days:
+                        selected = archive.select(name, fields, every, start, end, bbox)
+                        if fields and selected[fields[0]]:
+                            result[name] = convert_columns(selected, units) if units else selected
+            else:
+                return 404, json.dumps({'error': f"Unknown path: {path}"}).encode()
+        except QueryError as e:
+            return 400, json.dumps({'error': str(e)}).encode()
+        return 200, json.dumps(result).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            # Normalise the query order so equivalent requests share a cache entry
+            query = '&'.join(sorted(url.query.split('&'))) if url.query else ''
+            with stage('request'):
+                status, body = render(url.path, query)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the decoded ride archive over HTTP/JSON.")
+    parser.add_argument("--fitDir", default="./fitData",
+                        help="Directory of FIT files (default: ./fitData)")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765,
+                        help="Port to listen on (default: 8765)")
+    parser.add_argument("--cacheSize", type=int, default=256,
+                        help="Number of rendered responses to cache (default: 256)")
+    args, _ = parser.parse_known_args(argv)
+
+    # http.server is slow to import; keep it off --help
+    from http.server import ThreadingHTTPServer
+    from safeFitFile import write_error_log
+
+    error_log = []
+    with stage('load'):
+        archive = RideArchive(args.fitDir, error_log)
+    write_error_log(error_log)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(archive, args.cacheSize))
+    print(f"Serving on http://{args.host}:{server.server_address[1]} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped serving")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
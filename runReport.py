@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import platform
+from contextlib import contextmanager
+
+# The report for the command currently running, if reporting was requested
+_current = None
+# Where count_file() goes inside collect_files(), instead of the report
+_collected = None
+
+
+class RunReport(object):
+    """Stage timings, per-file throughput and peak memory for one command run."""
+
+    def __init__(self, command, args=None):
+        self.command = command
+        self.args = list(args or [])
+        self.started = time.time()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self.stages = {}
+        self.files = []
+
+    def add_stage(self, name, wall, cpu):
+        stage = self.stages.setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+        stage['calls'] += 1
+        stage['wall_s'] += wall
+        stage['cpu_s'] += cpu
+
+    def add_file(self, path, records, seconds, status='ok'):
+        self.files.append({
+            'file': os.path.basename(path),
+            'records': records,
+            'seconds': seconds,
+            'points_per_s': records / seconds if seconds else None,
+            'status': status,
+        })
+
+    def as_dict(self):
+        records = sum(f['records'] for f in self.files)
+        decode_seconds = sum(f['seconds'] for f in self.files)
+        return {
+            'command': self.command,
+            'args': self.args,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'wall_s': time.perf_counter() - self._wall_start,
+            'cpu_s': time.process_time() - self._cpu_start,
+            'peak_rss_mb': peak_rss_mb(),
+            'python': platform.python_version(),
+            'stages': self.stages,
+            'files': self.files,
+            'records': records,
+            'points_per_s': records / decode_seconds if decode_seconds else None,
+        }
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Worker processes count too: RUSAGE_CHILDREN has the largest finished child
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def start_report(command, args=None):
+    global _current
+    _current = RunReport(command, args)
+    return _current
+
+
+def finish_report(path):
+    """Append the current report to a JSON Lines file and stop reporting."""
+    global _current
+    report, _current = _current, None
+    if report is None:
+        return None
+    data = report.as_dict()
+    with open(path, 'a') as f:
+        f.write(json.dumps(data) + '\n')
+    # resource is missing on some platforms (Windows), leaving no peak to show
+    peak = f"{data['peak_rss_mb']:.1f} MB" if data['peak_rss_mb'] is not None else "n/a"
+    print(f"Run report appended to {path} ({data['wall_s']:.2f} s, peak {peak})")
+    return data
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage; does nothing unless a report was started."""
+    if _current is None:
+        yield
+        return
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        _current.add_stage(name, time.perf_counter() - wall_start, time.process_time() - cpu_start)
+
+
+def count_file(path, records, seconds, status='ok'):
+    if _collected is not None:
+        _collected.append((path, records, seconds, status))
+    elif _current is not None:
+        _current.add_file(path, records, seconds, status)
+
+
+@contextmanager
+def collect_files():
+    """Gather the count_file() calls made in the block into the yielded list.
+
+    Worker processes have no report of their own, so they return the list
+    and the parent passes it to record_files().
+    """
+    global _collected
+    previous, _collected = _collected, []
+    try:
+        yield _collected
+    finally:
+        _collected = previous
+
+
+def record_files(files):
+    for path, records, seconds, status in files:
+        count_file(path, records, seconds, status)
@@ -0,0 +1,170 @@
+import os
+import json
+import struct
+import time
+from runReport import stage, count_file
+from compressedFiles import read_bytes
+
+# CRC lookup table from the FIT SDK
+CRC_TABLE = [
+    0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+    0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400,
+]
+
+
+def _crc_nibbles(byte, crc):
+    tmp = CRC_TABLE[crc & 0xF]
+    crc = (crc >> 4) & 0x0FFF
+    crc = crc ^ tmp ^ CRC_TABLE[byte & 0xF]
+    tmp = CRC_TABLE[crc & 0xF]
+    crc = (crc >> 4) & 0x0FFF
+    return crc ^ tmp ^ CRC_TABLE[(byte >> 4) & 0xF]
+
+
+# The SDK nibble table expanded to whole bytes, one lookup per byte
+CRC_BYTE_TABLE = [_crc_nibbles(i, 0) for i in range(256)]
+
+
+def fit_crc(data, crc=0):
+    table = CRC_BYTE_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def check_fit_bytes(data):
+    """Validate the header and CRCs of a FIT file without decoding any messages."""
+    health = {
+        'header_ok': False,
+        'header_crc_ok': None,
+        'crc_ok': None,
+        'truncated': False,
+        'header_size': None,
+        'data_size': None,
+        'file_size': len(data),
+        'errors': [],
+    }
+    if len(data) < 12:
+        health['errors'].append(f"File too short for a FIT header ({len(data)} bytes)")
+        return health
+    header_size, _, _, data_size, magic = struct.unpack('<2BHI4s', data[:12])
+    health['header_size'] = header_size
+    health['data_size'] = data_size
+    if magic != b'.FIT':
+        health['errors'].append("Invalid .FIT file header")
+        return health
+    if header_size not in (12, 14) or len(data) < header_size:
+        health['errors'].append(f"Irregular file header size {header_size}")
+        return health
+    health['header_ok'] = True
+
+    if header_size == 14:
+        header_crc = struct.unpack('<H', data[12:14])[0]
+        # A zero header CRC means the writer did not compute one
+        health['header_crc_ok'] = header_crc == 0 or header_crc == fit_crc(data[:12])
+        if not health['header_crc_ok']:
+            health['errors'].append("Header CRC mismatch")
+
+    expected_size = header_size + data_size + 2
+    if len(data) < expected_size:
+        health['truncated'] = True
+        health['errors'].append(f"File truncated: expected {expected_size} bytes, got {len(data)}")
+    else:
+        file_crc = struct.unpack('<H', data[expected_size - 2:expected_size])[0]
+        health['crc_ok'] = file_crc == fit_crc(data[:expected_size - 2])
+        if not health['crc_ok']:
+            health['errors'].append("File CRC mismatch")
+    return health
+
+
+class RecoveredFitFile(object):
+    """Decoded messages of a FIT file, kept up to the first corrupt block.
+
+    Exposes the same get_messages() call the scripts already use on FitFile.
+    """
+
+    def __init__(self, messages, health):
+        self.messages = messages
+        self.health = health
+
+    def get_messages(self, name=None):
+        if name is None:
+            names = None
+        elif isinstance(name, (list, tuple, set)):
+            names = set(name)
+        else:
+            names = {name}
+        for message in self.messages:
+            if names is None or message.name in names or message.mesg_num in names:
+                yield message
+
+
+def open_fit_file(fit_file, error_log=None):
+    """Decode a FIT file, recovering every message before the first corrupt block.
+
+    Returns a RecoveredFitFile, or None if nothing could be decoded. A health
+    report for the file is appended to error_log when one is given.
+    """
+    from fitparse import FitFile
+
+    start = time.perf_counter()
+    health = {'file': os.path.basename(fit_file), 'path': fit_file}
+    try:
+        # Gzipped FIT files are decompressed transparently
+        data = read_bytes(fit_file)
+    except (OSError, EOFError) as e:
+        health.update({'status': 'unreadable', 'messages': 0, 'records': 0, 'errors': [str(e)]})
+        print(f"Warning: {health['file']} is unreadable: {e}")
+        count_file(fit_file, 0, time.perf_counter() - start, health['status'])
+        if error_log is not None:
+            error_log.append(health)
+        return None
+
+    with stage('check'):
+        health.update(check_fit_bytes(data))
+    messages = []
+    if health['header_ok']:
+        with stage('decode'):
+            try:
+                # CRCs were checked above, so let fitparse read straight through
+                fitfile = FitFile(data, check_crc=False)
+                for message in fitfile.get_messages():
+                    messages.append(message)
+            except Exception as e:
+                health['errors'].append(f"Decode stopped after {len(messages)} messages: {type(e).__name__}: {e}")
+
+    health['messages'] = len(messages)
+    health['records'] = sum(1 for m in messages if m.name == 'record')
+    if not messages:
+        health['status'] = 'unreadable'
+    elif health['errors']:
+        health['status'] = 'partial'
+    else:
+        health['status'] = 'ok'
+
+    if health['status'] != 'ok':
+        print(f"Warning: {health['file']} is {health['status']} ({health['messages']} messages recovered): "
+              + "; ".join(health['errors']))
+    count_file(fit_file, health['records'], time.perf_counter() - start, health['status'])
+    if error_log is not None:
+        error_log.append(health)
+    if not messages:
+        return None
+    return RecoveredFitFile(messages, health)
+
+
+def write_error_log(error_log, path='fit_errors.json'):
+    """Write the health reports of any files that were not fully readable.
+
+    With none, a log left by an earlier run is removed, so files repaired
+    since are no longer reported.
+    """
+    problems = [h for h in error_log if h.get('status') != 'ok']
+    if not problems:
+        if os.path.exists(path):
+            os.remove(path)
+        return problems
+    with open(path, 'w') as f:
+        json.dump(problems, f, indent=4)
+    print(f"{len(problems)} damaged FIT file(s) reported in {path}")
+    return problems
@@ -0,0 +1,142 @@
+import os
+import json
+import calendar
+from dataclasses import dataclass, fields
+from typing import Optional
+from units import semicircles_to_degrees, convert_column, to_canonical
+
+# Fields written to summary.json, in the order fitparse yields them (by name)
+SUMMARY_JSON_FIELDS = (
+    'avg_speed',
+    'avg_temperature',
+    'enhanced_avg_speed',
+    'enhanced_max_speed',
+    'max_speed',
+    'max_temperature',
+    'min_temperature',
+    'start_position_lat',
+    'start_position_long',
+    'total_ascent',
+    'total_calories',
+    'total_descent',
+    'total_distance',
+)
+
+
+@dataclass(slots=True)
+class SummaryRecord:
+    """Summary of one FIT file with numeric values in canonical units.
+
+    Speeds are m/s, temperatures degrees C, distances and climbs meters,
+    durations seconds, positions degrees and times Unix seconds. Formatting
+    for summary.json happens only in summary_json_entries().
+    """
+    fit_file_name: str
+    start_time: Optional[int] = None
+    end_time: Optional[int] = None
+    total_elapsed_time: Optional[float] = None
+    total_timer_time: Optional[float] = None
+    total_distance: Optional[float] = None
+    total_ascent: Optional[float] = None
+    total_descent: Optional[float] = None
+    total_calories: Optional[int] = None
+    avg_speed: Optional[float] = None
+    max_speed: Optional[float] = None
+    enhanced_avg_speed: Optional[float] = None
+    enhanced_max_speed: Optional[float] = None
+    avg_temperature: Optional[float] = None
+    max_temperature: Optional[float] = None
+    min_temperature: Optional[float] = None
+    start_position_lat: Optional[float] = None
+    start_position_long: Optional[float] = None
+    end_position_lat: Optional[float] = None
+    end_position_long: Optional[float] = None
+
+    @classmethod
+    def from_fit(cls, fit_file, fitfile):
+        """Build a record from a decoded FIT file, or None if it has no summary messages."""
+        summary = {}
+        # Collect summary fields from activity, session, and file_id messages
+        for msg_type in ['activity', 'session', 'file_id']:
+            for msg in fitfile.get_messages(msg_type):
+                for field in msg:
+                    summary[field.name] = field.value
+        if not summary:
+            return None
+        record = cls(os.path.basename(fit_file))
+        for name in ('total_elapsed_time', 'total_timer_time', 'total_distance', 'total_ascent',
+                     'total_descent', 'total_calories', 'avg_speed', 'max_speed', 'enhanced_avg_speed',
+                     'enhanced_max_speed', 'avg_temperature', 'max_temperature', 'min_temperature'):
+            setattr(record, name, summary.get(name))
+        for name in ('start_position_lat', 'start_position_long'):
+            if summary.get(name) is not None:
+                setattr(record, name, semicircles_to_degrees(summary[name]))
+        for name, key in (('start_time', 'start_time'), ('end_time', 'timestamp')):
+            if summary.get(key) is not None:
+                setattr(record, name, calendar.timegm(summary[key].utctimetuple()))
+
+        # Find ending lat/long from last record
+        for msg in fitfile.get_messages('record'):
+            lat = None
+            lon = None
+            for field in msg:
+                if field.name == 'position_lat':
+                    lat = field.value
+                elif field.name == 'position_long':
+                    lon = field.value
+            if lat is not None and lon is not None:
+                record.end_position_lat = semicircles_to_degrees(lat)
+                record.end_position_long = semicircles_to_degrees(lon)
+        return record
+
+    def to_summary_json(self, units='imperial'):
+        """Format as a summary.json entry, values as strings."""
+        return summary_json_entries([self], units)[0]
+
+    @classmethod
+    def from_summary_json(cls, entry, units='imperial'):
+        """Parse a summary.json entry back into canonical units."""
+        record = cls(entry.get('fitFileName', ''))
+        for field in fields(cls):
+            name = field.name
+            if name == 'fit_file_name' or entry.get(name) in (None, ''):
+                continue
+            v = to_canonical(float(entry[name]), name, units)
+            if name == 'total_calories':
+                v = int(v)
+            setattr(record, name, v)
+        return record
+
+
+def summary_json_entries(records, units='imperial'):
+    """Format records as summary.json entries, converting one field column at a time."""
+    columns = {name: convert_column([getattr(r, name) for r in records], name, units)
+               for name in SUMMARY_JSON_FIELDS}
+    entries = []
+    for i, record in enumerate(records):
+        out = {'fitFileName': record.fit_file_name}
+        for name in SUMMARY_JSON_FIELDS:
+            v = columns[name][i]
+            if v is None:
+                continue
+            if name in ("start_position_lat", "start_position_long"):
+                out[name] = f"{v:.6f}"
+            elif name == 'total_calories':
+                out[name] = f"{v}"
+            else:
+                out[name] = f"{v:.2f}"
+        if record.end_position_lat is not None and record.end_position_long is not None:
+            out["end_position_lat"] = f"{record.end_position_lat:.6f}"
+            out["end_position_long"] = f"{record.end_position_long:.6f}"
+        entries.append(out)
+    return entries
+
+
+def write_summary_json(records, path, units='imperial'):
+    with open(path, 'w') as f:
+        json.dump(summary_json_entries(records, units), f, indent=4)
+
+
+def load_summary_json(path, units='imperial'):
+    with open(path, 'r') as f:
+        return [SummaryRecord.from_summary_json(entry, units) for entry in json.load(f)]
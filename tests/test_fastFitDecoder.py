@@ -0,0 +1,49 @@
+"""Check the fast FIT decoder against fitparse on synthetic rides."""
+
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from benchmarks import synthetic
+from fastFitDecoder import RECORD_FIELDS, decode_record_columns, fitfile_record_columns
+from safeFitFile import open_fit_file
+
+FIELDS = tuple(RECORD_FIELDS) + ('enhanced_speed', 'enhanced_altitude')
+
+
+@pytest.fixture
+def fit_day(tmp_path):
+    path = str(tmp_path / 'Day_01.fit')
+    synthetic.write_fit_day(path, 1, 600, 48.5, -122.7, 1717225200)
+    return path
+
+
+def decode_both(path, fields):
+    with contextlib.redirect_stdout(io.StringIO()):
+        fast = decode_record_columns(path, fields)
+        slow = fitfile_record_columns(open_fit_file(path), fields)
+    return fast, slow
+
+
+@pytest.mark.parametrize('fields', [FIELDS, tuple(RECORD_FIELDS)])
+def test_columns_match_fitparse(fit_day, fields):
+    fast, slow = decode_both(fit_day, fields)
+    assert len(fast['timestamp']) == 600
+    assert fast == slow
+
+
+def test_truncated_file_matches_fitparse(fit_day, tmp_path):
+    with open(fit_day, 'rb') as f:
+        data = f.read()
+    path = str(tmp_path / 'Day_02.fit')
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    fast, slow = decode_both(path, tuple(RECORD_FIELDS))
+    assert 0 < len(fast['timestamp']) < 600
+    assert fast == slow
@@ -0,0 +1,98 @@
+"""Unit conversion for whole columns of ride data.
+
+Values are decoded in canonical units: meters, m/s, degrees C and FIT
+semicircles for positions. A field's conversion is looked up once and
+applied to its whole column in one pass, with None (or NaN) kept for
+missing values.
+"""
+
+SEMICIRCLES_TO_DEGREES = 180.0 / 2**31
+
+UNIT_SYSTEMS = ('imperial', 'metric')
+
+# quantity -> {units: (label, scale, offset)}; display value = canonical * scale + offset
+CONVERSIONS = {
+    'speed': {'imperial': ('mph', 2.23694, 0.0), 'metric': ('km/h', 3.6, 0.0)},
+    'temperature': {'imperial': ('F', 1.8, 32.0), 'metric': ('C', 1.0, 0.0)},
+    'elevation': {'imperial': ('ft', 3.28084, 0.0), 'metric': ('m', 1.0, 0.0)},
+    'distance': {'imperial': ('miles', 1 / 1609.34, 0.0), 'metric': ('km', 1 / 1000.0, 0.0)},
+}
+
+# field name -> quantity
+FIELD_QUANTITIES = {
+    'speed': 'speed',
+    'enhanced_speed': 'speed',
+    'avg_speed': 'speed',
+    'max_speed': 'speed',
+    'enhanced_avg_speed': 'speed',
+    'enhanced_max_speed': 'speed',
+    'temperature': 'temperature',
+    'avg_temperature': 'temperature',
+    'max_temperature': 'temperature',
+    'min_temperature': 'temperature',
+    'altitude': 'elevation',
+    'enhanced_altitude': 'elevation',
+    'total_ascent': 'elevation',
+    'total_descent': 'elevation',
+    'distance': 'distance',
+    'total_distance': 'distance',
+}
+
+
+def add_units_argument(parser, default='imperial'):
+    parser.add_argument("--units", choices=UNIT_SYSTEMS, default=default,
+                        help=f"Units for speeds, distances, climbs and temperatures (default: {default})")
+
+
+def conversion(field, units='imperial'):
+    """Return (label, scale, offset) for a field, or None if it has no unit conversion."""
+    quantity = FIELD_QUANTITIES.get(field)
+    if quantity is None:
+        return None
+    return CONVERSIONS[quantity][units]
+
+
+def unit_label(field, units='imperial'):
+    found = conversion(field, units)
+    return found[0] if found else ''
+
+
+def convert_column(values, field, units='imperial'):
+    """Convert a whole column of canonical values of one field to the given units."""
+    found = conversion(field, units)
+    if found is None:
+        return list(values)
+    _, scale, offset = found
+    if offset:
+        return [None if v is None else v * scale + offset for v in values]
+    if scale != 1.0:
+        return [None if v is None else v * scale for v in values]
+    return list(values)
+
+
+def convert_value(value, field, units='imperial'):
+    return convert_column((value,), field, units)[0]
+
+
+def to_canonical(value, field, units='imperial'):
+    """Undo convert_value for one value."""
+    found = conversion(field, units)
+    if found is None or value is None:
+        return value
+    _, scale, offset = found
+    return (value - offset) / scale
+
+
+def convert_columns(columns, units='imperial'):
+    """Convert every column of a {field: values} dict."""
+    return {field: convert_column(values, field, units) for field, values in columns.items()}
+
+
+def semicircles_to_degrees(semicircles):
+    """Convert Garmin FIT semicircles to degrees."""
+    return semicircles * SEMICIRCLES_TO_DEGREES
+
+
+def degrees_column(values):
+    """Convert a whole column of semicircles to degrees."""
+    return [None if v is None else v * SEMICIRCLES_TO_DEGREES for v in values]
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+watchFitData.py
+
+Watch ./fitData and fold new FIT files into the outputs as they land.
+
+Usage:
+    python watchFitData.py [--interval 2] [--settle 5] [--once]
+
+A new Day_NN.fit is decoded on its own and appended to summary.json,
+ride_start_locations.kml and us_ride_detail.kml; no other file is decoded
+again. Files must keep the same size and mtime for --settle seconds before
+they are read, so a half-synced Dropbox file is never ingested. A file that
+changes after ingestion, or that sorts before one already ingested, triggers
+a full rebuild instead. A rebuild reads every file, settled or not, and
+records them all in the state, so one still syncing is rebuilt again once
+it changes rather than appended a second time.
+"""
+
+import argparse
+import json
+import os
+import time
+
+from compressedFiles import is_fit_file
+from drawDetailDayRoute import extract_order_key
+from runReport import stage
+
+FIT_DIR = './fitData'
+SUMMARY_FILE = 'summary.json'
+START_KML = 'ride_start_locations.kml'
+DETAIL_KML = 'us_ride_detail.kml'
+STATE_FILE = '.watch_state.json'
+ERROR_LOG = 'fit_errors.json'
+
+# How far back from the end of a KML file to look for the insertion point
+TAIL_BYTES = 64 * 1024
+
+
+def scan(fit_dir):
+    files = {}
+    for name in os.listdir(fit_dir):
+        if is_fit_file(name):
+            st = os.stat(os.path.join(fit_dir, name))
+            files[name] = [st.st_mtime, st.st_size]
+    return files
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return None
+    with open(STATE_FILE) as f:
+        return json.load(f)
+
+
+def save_state(state):
+    tmp = STATE_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp, STATE_FILE)
+
+
+def rewrite_tail(path, locate, replace):
+    """Rewrite the end of a file from the offset locate(tail) returns.
+
+    replace(tail) returns the new bytes for that tail. Only the end of the
+    file is read and written. Returns False if locate finds nothing (-1).
+    """
+    with open(path, 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        start = max(0, size - TAIL_BYTES)
+        f.seek(start)
+        tail = f.read()
+        idx = locate(tail)
+        if idx < 0:
+            return False
+        f.seek(start + idx)
+        f.truncate()
+        f.write(replace(tail[idx:]))
+    return True
+
+
+def append_summary(record):
+    with open(SUMMARY_FILE) as f:
+        summary_json = json.load(f)
+    summary_json.append(record.to_summary_json())
+    tmp = SUMMARY_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(summary_json, f, indent=4)
+    os.replace(tmp, SUMMARY_FILE)
+
+
+def append_start_location(record):
+    """Add the day's start point and move the End point to the new ride's end."""
+    from drawDayRoute import KML_FOOTER, start_placemark, end_placemark
+
+    new_text = (start_placemark(record) or '') + (end_placemark(record) or '') + KML_FOOTER
+    end_marker = b'    <Placemark>\n        <name>End</name>'
+    if rewrite_tail(START_KML, lambda tail: tail.rfind(end_marker), lambda tail: new_text.encode()):
+        return True
+    return rewrite_tail(START_KML, lambda tail: tail.rfind(b'</Document>'), lambda tail: new_text.encode())
+
+
+def append_detail(fit_path, points):
+    """Extend the route line with the day's points and add its day label."""
+    day, part = extract_order_key(fit_path)
+    label = ''
+    if points and part in (0, 1) and day != float('inf'):
+        lat, lon = points[0]
+        label = (f"        <Placemark>\n            <name>{day:02d}</name>\n            <Point>\n"
+                 f"                <coordinates>{lon},{lat},0.0</coordinates>\n"
+                 f"            </Point>\n        </Placemark>\n")
+    coords = ''.join(f" {lon},{lat},0.0" for lat, lon in points)
+
+    def locate(tail):
+        # The end of the route line, not of a day label added after it
+        return tail.rfind(b'</coordinates>', 0, tail.rfind(b'</LineString>'))
+
+    def replace(tail):
+        # tail starts at </coordinates>; the label goes just before </Document>
+        doc_end = tail.rfind(b'    </Document>')
+        return coords.encode() + tail[:doc_end] + label.encode() + tail[doc_end:]
+
+    return rewrite_tail(DETAIL_KML, locate, replace)
+
+
+def update_error_log(error_log):
+    """Replace the reports of these files in fit_errors.json, keeping those of the others."""
+    from safeFitFile import write_error_log
+
+    kept = []
+    if os.path.exists(ERROR_LOG):
+        names = {h['file'] for h in error_log}
+        with open(ERROR_LOG) as f:
+            kept = [h for h in json.load(f) if h['file'] not in names]
+    write_error_log(kept + error_log, ERROR_LOG)
+
+
+def ingest(fit_path):
+    """Decode one new FIT file and append it to every output."""
+    from buildSummaryFile import print_summary_fields
+    from fastFitDecoder import fast_latlon_every_n_seconds
+
+    error_log = []
+    records = []
+    print_summary_fields(fit_path, records, error_log)
+    with stage('sample'):
+        points = fast_latlon_every_n_seconds(fit_path, seconds=30)
+    update_error_log(error_log)
+    with stage('write'):
+        if records:
+            append_summary(records[0])
+            if not append_start_location(records[0]):
+                return False
+        if points and not append_detail(fit_path, points):
+            return False
+    print(f"Appended {os.path.basename(fit_path)}: {len(points)} route points")
+    return True
+
+
+def rebuild_all():
+    """Rebuild every output from all of fitData; returns the files it read as {name: [mtime, size]}.
+
+    Half-synced files are read too, so they are part of the returned state:
+    when they change again they trigger another rebuild, never an append.
+    The scan comes first, so a file that changes during the rebuild does too.
+    """
+    import buildSummaryFile
+    import drawDayRoute
+    import drawDetailDayRoute
+
+    files = scan(FIT_DIR)
+    print("Rebuilding all outputs")
+    buildSummaryFile.main([])
+    drawDayRoute.main([])
+    drawDetailDayRoute.main(['--fast'])
+    return files
+
+
+def process(changed, state, current):
+    """Ingest the changed files and return the new state.
+
+    state maps file name -> [mtime, size] already in the outputs, and
+    current is the latest scan.
+    """
+    changed = sorted(changed, key=lambda name: extract_order_key(name))
+    last_key = max((extract_order_key(name) for name in state), default=None)
+    outputs_exist = all(os.path.exists(p) for p in (SUMMARY_FILE, START_KML, DETAIL_KML))
+    incremental = outputs_exist and all(
+        name not in state and (last_key is None or extract_order_key(name) > last_key)
+        for name in changed)
+
+    if incremental:
+        for name in changed:
+            if not ingest(os.path.join(FIT_DIR, name)):
+                incremental = False
+                break
+    if not incremental:
+        return rebuild_all()
+    return dict(state, **{name: current[name] for name in changed})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch ./fitData and append new rides to the outputs.")
+    parser.add_argument("--interval", type=float, default=2.0,
+                        help="Seconds between scans (default: 2)")
+    parser.add_argument("--settle", type=float, default=5.0,
+                        help="Seconds a file must stay unchanged before it is read (default: 5)")
+    parser.add_argument("--once", action="store_true",
+                        help="Process whatever is new right now and exit")
+    args, _ = parser.parse_known_args(argv)
+
+    state = load_state()
+    if state is None:
+        # No record of what the outputs contain, so start from a full build
+        state = rebuild_all()
+        save_state(state)
+    if args.once:
+        current = scan(FIT_DIR)
+        changed = [name for name, stat in current.items() if state.get(name) != stat]
+        if changed:
+            save_state(process(changed, state, current))
+        return
+
+    print(f"Watching {FIT_DIR} (Ctrl-C to stop)")
+    pending = {}
+    try:
+        while True:
+            now = time.time()
+            current = scan(FIT_DIR)
+            ready = []
+            for name, stat in current.items():
+                if state.get(name) == stat:
+                    pending.pop(name, None)
+                    continue
+                seen = pending.get(name)
+                if seen is None or seen[0] != stat:
+                    # New or still changing: (re)start its settle timer
+                    pending[name] = (stat, now)
+                elif now - seen[1] >= args.settle:
+                    ready.append(name)
+            if ready:
+                state = process(ready, state, current)
+                for name in ready:
+                    pending.pop(name)
+                save_state(state)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+
+if __name__ == "__main__":
+    main()